@@ -7,13 +7,6 @@ import static.stringutil as su
 import static.settings as settings
 import static.console as console
 import static.metadata as meta
-from sources import DirectInputSource, DirectURLSource, DirectFileSource
-from interfaces.terminal import TerminalUI
-from interfaces.eelwrapper import WebUI
-import tests.runner
-import tests.mock  # Required import to properly bootstrap tests when compiled.
-import sql
-from tools import ffmpeg_download
 import static.filesystem as fs
 import re
 import logging
@@ -35,6 +28,7 @@ parser.add_argument("--skip_update", help="If set, avoid checking for updates au
 parser.add_argument("--import_csv", help="Import all comments/posts from an export CSV file.", type=str, metavar='', default=None)
 parser.add_argument("--full_csv", help="If set, include a slower method as a fallback when loading a CSV.", action="store_true")
 parser.add_argument("--docker", help="If set, activate 'Docker Mode'.", action="store_true")
+parser.add_argument("--rehash", help="Hash every file in the download directory into the hash cache, then exit.", action="store_true")
 args, unknown_args = parser.parse_known_args()
 
 
@@ -51,6 +45,8 @@ def run():
 		sys.exit(0)
 
 	if args.run_tests:
+		import tests.runner
+		import tests.mock  # Required import to properly bootstrap tests when compiled.
 		error_count = tests.runner.run_tests(test_subdir=args.run_tests)
 		sys.exit(error_count)
 
@@ -69,6 +65,10 @@ def run():
 				print()
 		sys.exit()
 
+	# Everything past this point needs the Sources and the manifest, so these (slower) imports are deferred until now.
+	from sources import DirectInputSource, DirectURLSource, DirectFileSource
+	import sql
+
 	settings_file = args.settings or fs.find_file('settings.json')
 	_loaded = settings_file is not None# settings.load(settings_file)
 	for ua in unknown_args:
@@ -90,6 +90,17 @@ def run():
 			print('Unknown setting: %s' % k)
 			sys.exit(50)
 
+	if args.rehash:
+		from tools.rehash_library import rehash_library
+		from processing.hash_cache import get_cache_location
+		cache_file = get_cache_location()
+		if not cache_file:
+			su.error('The hash cache is disabled. Set "output.hash_cache" to use it.')
+			sys.exit(1)
+		workers = settings.get('processing.hash_workers') or None
+		rehash_library(settings.get('output.base_dir'), cache_file, workers=workers, skip=[sql.get_file_location()])
+		sys.exit(0)
+
 	if args.source:
 		matched_sources = set()
 		for s in args.source:
@@ -156,6 +167,7 @@ def run():
 					su.error('Failed to gain an account access token from Reddit with that code. Please try again.')
 		sys.exit(0)
 
+	from tools import ffmpeg_download
 	if not ffmpeg_download.install_local():
 		print("RMD was unable to locate (or download) a working FFmpeg binary.")
 		print("For downloading and post-processing, this is a required tool.")
@@ -176,8 +188,10 @@ def run():
 
 	if settings.get('interface.start_server') and not direct_sources:
 		print("Starting WebUI...")
+		from interfaces.eelwrapper import WebUI
 		ui = WebUI()
 	else:
+		from interfaces.terminal import TerminalUI
 		ui = TerminalUI()
 	ui.display()
 
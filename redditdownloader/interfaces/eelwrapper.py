@@ -8,7 +8,7 @@ from static import settings
 from static import praw_wrapper
 from static import metadata
 from interfaces import UserInterface
-from processing.wrappers import SanitizedRelFile
+from processing.wrappers import SanitizedRelFile, stat_files
 from processing.controller import RMDController
 import sql
 
@@ -49,7 +49,6 @@ stopped = False
 _web_dir = None
 _controller = None  # type: RMDController
 _session = None
-_stat_cache = None
 
 
 def start(web_dir):
@@ -103,18 +102,8 @@ def _websocket_close(page, old_websockets):
 
 
 def get_cached_stats():
-	""" Track and cache misc stats for RMD. Cache is invalidated when downloading starts. """
-	global _stat_cache
-	if not _stat_cache:
-		_stat_cache = {
-			'total_files': _session.query(sql.File).count(),
-			'total_files_dl': _session.query(sql.File).filter(sql.File.downloaded).count(),
-			'total_submissions': _session.query(sql.Post).filter(sql.Post.type == 'Submission').count(),
-			'total_comments': _session.query(sql.Post).filter(sql.Post.type == 'Comment').count(),
-			'total_urls': _session.query(sql.URL).filter(sql.URL.processed).count(),
-			'total_urls_failed': _session.query(sql.URL).filter(sql.URL.failed).count()
-		}
-	return _stat_cache
+	""" Get misc stats for RMD. These are counters kept up to date in the manifest, so this is always cheap. """
+	return sql.get_stats(_session)
 
 
 @eel.btl.route('/file')
@@ -228,18 +217,19 @@ def api_searchable_fields():
 def api_search_posts(fields, term, page_size, page):
 	ret = []
 	searcher = sql.PostSearcher(_session)
-	res = searcher.search_fields(fields, term.strip("%"))
-	full_len = len(res)
-	res = res[page*page_size:page*page_size+page_size]
+	full_len, res = searcher.search_page(fields, term.strip("%"), page_size, page)
+	base_dir = settings.get("output.base_dir")
+	post_files = {}
 	for p in res:
-		files = []
+		post_files[p.reddit_id] = []
 		for url in p.urls:
 			if not url.file:
 				print('Post URL Missing a File:', url)
 				continue
-			file = SanitizedRelFile(base=settings.get("output.base_dir"), file_path=url.file.path)
-			if file.is_file():
-				files.append({'token': url.file.id, 'path': file.absolute()})
+			post_files[p.reddit_id].append((url.file.id, SanitizedRelFile(base=base_dir, file_path=url.file.path)))
+	existing = stat_files(rf for pf in post_files.values() for _, rf in pf)
+	for p in res:
+		files = [{'token': file_id, 'path': rf.absolute()} for file_id, rf in post_files[p.reddit_id] if rf.absolute() in existing]
 		if len(files):
 			ret.append({
 				'reddit_id': p.reddit_id,
@@ -270,13 +260,12 @@ def api_shutdown():
 
 @eel.expose
 def start_download():
-	global _controller, _stat_cache
+	global _controller
 	if _controller is not None and _controller.is_running():
 		return False
 	else:
 		_controller = RMDController()
 		_controller.start()
-		_stat_cache = None
 		print('Started downloader.')
 		return True
 
@@ -0,0 +1,52 @@
+def hamming_distance(a, b):
+	""" Count the bits which differ between the two given 64-bit integers, which may be signed. """
+	return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+class BKTree:
+	"""
+	An in-memory Burkhard-Keller tree over integer hashes, using Hamming distance as the metric.
+	This finds every hash within a small distance of a search hash, while only visiting a fraction of the tree.
+	Each node stores one hash value, along with every item that has that hash.
+	"""
+	def __init__(self):
+		self._root = None
+		self._size = 0
+
+	def __len__(self):
+		return self._size
+
+	def add(self, value, item):
+		""" Add the given item to the tree, under the given hash value. """
+		self._size += 1
+		if self._root is None:
+			self._root = (value, [item], {})
+			return
+		node = self._root
+		while True:
+			dist = hamming_distance(value, node[0])
+			if dist == 0:
+				node[1].append(item)
+				return
+			child = node[2].get(dist)
+			if child is None:
+				node[2][dist] = (value, [item], {})
+				return
+			node = child
+
+	def search(self, value, max_distance):
+		""" Find every item whose hash is within `max_distance` bits of the given value. """
+		found = []
+		if self._root is None:
+			return found
+		nodes = [self._root]
+		while nodes:
+			node = nodes.pop()
+			dist = hamming_distance(value, node[0])
+			if dist <= max_distance:
+				found.extend(node[1])
+			# By the triangle inequality, matches can only be under children within this distance range.
+			for child_dist, child in node[2].items():
+				if dist - max_distance <= child_dist <= dist + max_distance:
+					nodes.append(child)
+		return found
@@ -6,10 +6,12 @@ import importlib
 from static import settings
 from static import stringutil as su
 from processing.redditloader import RedditLoader
-from processing.downloader import Downloader
-from processing.post_processing import Deduplicator
+from processing.downloader import Downloader, AsyncDownloader
+from processing.post_processing import Deduplicator, HashWorker
+from processing.hash_cache import get_cache_location
 from processing.wrappers import ProgressManifest
-from multiprocessing import RLock
+from multiprocessing import RLock, Queue, Event
+import os
 import custom_sources
 
 class RMDController(threading.Thread):
@@ -21,17 +23,24 @@ class RMDController(threading.Thread):
 		self.sources = source_patterns
 		self.sources = self.load_sources()
 		self.db_lock = RLock()
+		self.file_queue = Queue() if settings.get('processing.deduplicate_files') else None
+		self.hash_jobs, self.hash_results, self.hash_stop = Queue(), Queue(), Event()
 		# initialize Loader
 		self.loader = RedditLoader(sources=self.sources, settings_json=settings.to_json(), db_lock=self.db_lock)
 		self.deduplicator = Deduplicator(
 			settings_json=settings.to_json(),
 			stop_event=self.loader.get_stop_event(),
-			db_lock=self.db_lock
+			db_lock=self.db_lock,
+			file_queue=self.file_queue,
+			job_queue=self.hash_jobs,
+			result_queue=self.hash_results,
+			hash_stop=self.hash_stop
 		)
 		self._downloaders = self._create_downloaders()
 		self._all_processes = [self.loader, *self._downloaders]
 		if settings.get('processing.deduplicate_files'):
 			self._all_processes.append(self.deduplicator)
+			self._all_processes.extend(self._create_hash_workers())
 
 	def run(self):
 		for dl in self._all_processes:
@@ -67,14 +76,43 @@ class RMDController(threading.Thread):
 			return True
 		return False
 
+	def _create_hash_workers(self):
+		""" Build the pool of HashWorkers for the Deduplicator. These are started here, since it is a daemon. """
+		count = settings.get('processing.hash_workers') or os.cpu_count() or 1
+		cache_file = get_cache_location()
+		return [HashWorker(self.hash_jobs, self.hash_results, self.hash_stop, cache_file) for _ in range(max(1, count))]
+
 	def _create_downloaders(self):
+		if settings.get('threading.download_engine') == 'async':
+			return self._create_async_downloaders()
 		dls = []
 		for i in range(settings.get('threading.concurrent_downloads')):
 			tp = Downloader(
 				reader=self.loader.get_reader(),
 				ack_queue=self.loader.get_ack_queue(),
 				settings_json=settings.to_json(),
-				db_lock=self.db_lock
+				db_lock=self.db_lock,
+				file_queue=self.file_queue
+			)
+			dls.append(tp)
+		return dls
+
+	def _create_async_downloaders(self):
+		"""
+		Spread the concurrent downloads across a few AsyncDownloader Processes.
+		More Processes are used if needed, so none of them runs more slots than it has pooled HTTP connections.
+		"""
+		total = max(1, settings.get('threading.concurrent_downloads'))
+		procs = max(1, min(total, settings.get('threading.async_processes')), -(-total // AsyncDownloader.max_slots()))
+		dls = []
+		for i in range(procs):
+			tp = AsyncDownloader(
+				reader=self.loader.get_reader(),
+				ack_queue=self.loader.get_ack_queue(),
+				settings_json=settings.to_json(),
+				db_lock=self.db_lock,
+				max_tasks=(total // procs) + (1 if i < total % procs else 0),
+				file_queue=self.file_queue
 			)
 			dls.append(tp)
 		return dls
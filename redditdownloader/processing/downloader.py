@@ -2,8 +2,11 @@ from logging import debug
 import multiprocessing
 import sql
 from static import settings
-from processing.wrappers import SanitizedRelFile, AckPacket, DownloaderProgress
+from processing.wrappers import SanitizedRelFile, AckPacket, DownloaderProgress, TaskProgress, http_downloader
 from processing import handlers
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import queue
 import uuid
 import traceback
 from os import utime
@@ -11,87 +14,229 @@ from time import time
 
 
 class Downloader(multiprocessing.Process):
-	def __init__(self, reader, ack_queue, settings_json, db_lock):
+	def __init__(self, reader, ack_queue, settings_json, db_lock, file_queue=None):
 		"""
 		Create a Downloader Process, which will be bound to the queue given, listening for URLs to download.
+		If `file_queue` is given, the ID of every File downloaded is sent to it for deduplication.
 		"""
 		super().__init__()
 		self._reader = reader
+		self._file_queue = file_queue
 		self._settings = settings_json
 		self.progress = DownloaderProgress()
 		self._session = None
 		self._db_lock = db_lock
 		self._ack_queue = ack_queue
+		self._pending_acks = []
+		self._acks_started = None
+		self._ack_batch_size = 1
+		self._ack_batch_ms = 0
 		self.daemon = True
 
 	def run(self):
 		""" Threaded loading of elements. """
-		settings.from_json(self._settings)
-		sql.init_from_settings()
-		self._session = sql.session()
-		self.progress.clear(status="Starting up...", running=True)
+		self._setup()
 		failed = False
-		
-		for nxt_id in self._reader:
+
+		while True:
+			nxt_id = self._next_url()
+			if nxt_id is None:
+				break
 			try:
-				url = self._session.query(sql.URL).filter(sql.URL.id == nxt_id).first()
-				#print("downloading %s to %s"%(url.address, url.file.path), debug=True)
-				if not url:
-					raise Exception("Unknown URL ID provided: (%s}" % nxt_id)
-
-				file = url.file
-				path = SanitizedRelFile(base=settings.get("output.base_dir"), file_path=str(file.path))
-
-				self.progress.set_file(path.relative())
-				self.progress.set_status("Attempting to Handle URL...")
-				self.progress.set_running(True)
-
-				task = handlers.HandlerTask(url=url.address, file_obj=path)
-				resp = handlers.handle(task, self.progress)
-
-				is_album_parent = False
-
-				with self._db_lock:
-					#print("updating %s, %s, %s"%(url.failed, url.address, url.file.path), debug=True)
-					if resp.album_urls:
-						if url.album_id:
-							resp.album_urls = []  # Ignore nested Albums to avoid recursion.
-						else:
-							url.album_id = str(uuid.uuid4())
-							is_album_parent = True
-					else:
-						resp.album_urls = []
-
-					url.failed = not resp.success
-					url.failure_reason = resp.failure_reason
-					url.last_handler = resp.handler
-					url.album_is_parent = is_album_parent
-
-					if resp.rel_file:
-						file.downloaded = True
-						file.path = resp.rel_file.relative()
-						file.hash = None
-						utime(resp.rel_file.absolute(), times=(time(), time()))
-
-					self._session.commit()
-
-				# Once *all* processing is completed on this URL, the Downloader needs to ACK it.
-				# If any additional Album URLS were located, they should be sent before the ACK.
-				self._ack_queue.put(AckPacket(
-					url_id=nxt_id,
-					extra_urls=resp.album_urls
-				))
+				self._process_url(nxt_id, self.progress)
 				self.progress.clear(status="Waiting for URL...")
 			except Exception as ex:
 				failed = str(ex)
-				self._ack_queue.put(AckPacket(
-					url_id=nxt_id,
-					extra_urls=[]
-				))
+				self._ack(nxt_id)
 				print(ex)
 				traceback.print_exc()
 				self.progress.set_error("Exited with error: {%s}" % failed)
 				break
 
+		self._flush_acks()
 		sql.close()
+		self._print_connection_stats()
 		self.progress.clear("Finished." if not failed else "Exited with error: %s" % failed, running=False)
+
+	def _setup(self):
+		settings.from_json(self._settings)
+		sql.init_from_settings()
+		self._session = sql.session()
+		self._ack_batch_size = max(1, settings.get('threading.ack_batch_size'))
+		self._ack_batch_ms = max(0, settings.get('threading.ack_batch_ms'))
+		self.progress.clear(status="Starting up...", running=True)
+
+	def _next_url(self):
+		""" Get the next URL ID to download. Any batched ACKs are sent before waiting on an empty queue. """
+		if self._pending_acks:
+			try:
+				return self._reader.next(hang=False)
+			except queue.Empty:
+				self._flush_acks()
+		return self._reader.next()
+
+	def _ack(self, url_id, extra_urls=None):
+		"""
+		Queue an ACK for the given URL ID, to be sent to the Loader in a batch.
+		The batch is sent once it is full or old enough, or right away if the URL found Album URLs to download.
+		"""
+		if not self._pending_acks:
+			self._acks_started = time()
+		self._pending_acks.append(AckPacket(url_id=url_id, extra_urls=extra_urls or []))
+		age_ms = (time() - self._acks_started) * 1000
+		if extra_urls or len(self._pending_acks) >= self._ack_batch_size or age_ms >= self._ack_batch_ms:
+			self._flush_acks()
+
+	def _flush_acks(self):
+		""" Send every pending ACK to the Loader, as a single list. """
+		if self._pending_acks:
+			self._ack_queue.put(self._pending_acks)
+			self._pending_acks = []
+
+	def _print_connection_stats(self):
+		stats = http_downloader.connection_stats()
+		if stats['requests']:
+			print("%s sent %s HTTP requests over %s connections (%s reused)." %
+				  (self.name, stats['requests'], stats['connections'], stats['reused']))
+
+	def _process_url(self, nxt_id, progress):
+		""" Download the given URL ID, save the outcome, and ACK it. """
+		url, task = self._load_task(nxt_id, progress)
+		resp = handlers.handle(task, progress)
+		self._save_response(url, resp)
+
+	def _load_task(self, nxt_id, progress):
+		""" Look up the given URL ID, and build the HandlerTask to download it. """
+		url = self._session.query(sql.URL).filter(sql.URL.id == nxt_id).first()
+		#print("downloading %s to %s"%(url.address, url.file.path), debug=True)
+		if not url:
+			raise Exception("Unknown URL ID provided: (%s}" % nxt_id)
+
+		file = url.file
+		path = SanitizedRelFile(base=settings.get("output.base_dir"), file_path=str(file.path))
+
+		progress.set_file(path.relative())
+		progress.set_status("Attempting to Handle URL...")
+		progress.set_running(True)
+
+		return url, handlers.HandlerTask(url=url.address, file_obj=path)
+
+	def _save_response(self, url, resp):
+		""" Store the given HandlerResponse for the given URL, then ACK the URL back to the Loader. """
+		file = url.file
+		is_album_parent = False
+
+		with self._db_lock:
+			#print("updating %s, %s, %s"%(url.failed, url.address, url.file.path), debug=True)
+			if resp.album_urls:
+				if url.album_id:
+					resp.album_urls = []  # Ignore nested Albums to avoid recursion.
+				else:
+					url.album_id = str(uuid.uuid4())
+					is_album_parent = True
+			else:
+				resp.album_urls = []
+
+			url.failed = not resp.success
+			url.failure_reason = resp.failure_reason
+			url.last_handler = resp.handler
+			url.album_is_parent = is_album_parent
+
+			if resp.rel_file:
+				file.downloaded = True
+				file.path = resp.rel_file.relative()
+				file.hash = None
+				file.sha1 = resp.sha1
+				file.size = resp.size
+				utime(resp.rel_file.absolute(), times=(time(), time()))
+
+			self._session.commit()
+
+		if resp.rel_file and self._file_queue is not None:
+			self._file_queue.put(file.id)
+
+		# Once *all* processing is completed on this URL, the Downloader needs to ACK it.
+		# If any additional Album URLS were located, they should be sent with the ACK.
+		self._ack(url.id, resp.album_urls)
+
+
+class AsyncDownloader(Downloader):
+	def __init__(self, reader, ack_queue, settings_json, db_lock, max_tasks, file_queue=None):
+		"""
+		Create an asyncio-based Downloader Process, which runs up to `max_tasks` downloads at once.
+		The Handlers are blocking, so each transfer runs in a small thread pool owned by the event loop,
+		while all database access and ACKs stay on the event loop's thread.
+		Every slot's thread shares this Process' requests Session, so `max_tasks` is capped at the Session's
+		connection pool size (see `max_slots`) - spread larger download counts across more Processes instead.
+		"""
+		super().__init__(reader, ack_queue, settings_json, db_lock, file_queue)
+		self._max_tasks = max(1, max_tasks)
+		self._active = {}
+		self._errors = 0
+
+	@staticmethod
+	def max_slots():
+		""" The most download slots a single AsyncDownloader may run, which is one per pooled HTTP connection. """
+		return max(1, settings.get('threading.http_pool_size'))
+
+	def run(self):
+		""" Threaded loading of elements. """
+		self._setup()
+		self._max_tasks = min(self._max_tasks, self.max_slots())
+		loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+		executor = ThreadPoolExecutor(max_workers=self._max_tasks)
+		loop.set_default_executor(executor)
+		try:
+			loop.run_until_complete(asyncio.gather(*[self._worker(loop, slot) for slot in range(self._max_tasks)]))
+		finally:
+			self._flush_acks()
+			executor.shutdown(wait=True)
+			loop.close()
+			sql.close()
+		self._print_connection_stats()
+		status = "Finished." if not self._errors else "Finished, with %s errors." % self._errors
+		self.progress.clear(status, running=False)
+
+	async def _worker(self, loop, slot):
+		""" A single download slot, which keeps pulling URLs from the reader until it runs dry. """
+		while True:
+			nxt_id = await self._next_url_async(loop)
+			if nxt_id is None:
+				break
+			prog = TaskProgress()
+			self._active[slot] = prog
+			try:
+				url, task = self._load_task(nxt_id, prog)
+				self._update_progress(prog)
+				resp = await loop.run_in_executor(None, handlers.handle, task, prog)
+				self._save_response(url, resp)
+			except Exception as ex:
+				# Unlike the single-download Process, one bad URL should not stop every other slot.
+				self._errors += 1
+				self._session.rollback()
+				self._ack(nxt_id)
+				print(ex)
+				traceback.print_exc()
+				self.progress.set_error("Error in download slot: {%s}" % ex)
+			finally:
+				del self._active[slot]
+				self._update_progress()
+
+	async def _next_url_async(self, loop):
+		""" Like `_next_url`, but the reader runs in the thread pool while batched ACKs stay on the loop's thread. """
+		if self._pending_acks:
+			try:
+				return await loop.run_in_executor(None, self._reader.next, False)
+			except queue.Empty:
+				self._flush_acks()
+		return await loop.run_in_executor(None, self._reader.next)
+
+	def _update_progress(self, latest=None):
+		""" Summarize the active download slots into this Process' shared Progress object. """
+		if not self._active:
+			self.progress.clear(status="Waiting for URL...", running=True)
+			return
+		self.progress.set_status("Downloading %s of %s files at once..." % (len(self._active), self._max_tasks))
+		if latest:
+			self.progress.set_file(latest.get_file())
@@ -18,12 +18,14 @@ class HandlerTask:
 
 
 class HandlerResponse:
-	def __init__(self, success, handler, rel_file=None, failure_reason=None, album_urls=()):
+	def __init__(self, success, handler, rel_file=None, failure_reason=None, album_urls=(), sha1=None, size=None):
 		self.rel_file = rel_file
 		self.success = success
 		self.handler = handler
 		self.failure_reason = failure_reason
 		self.album_urls = album_urls
+		self.sha1 = sha1  # The SHA1 hex digest & byte size of the downloaded file, if the Handler computed them.
+		self.size = size
 
 
 def handle(handler_task, progress_obj):
@@ -12,12 +12,14 @@ order = 50
 def handle(task, progress):
 	url = task.url
 	progress.set_status("Checking for direct url...")
-	ext, stat = http_downloader.is_media_url(url, return_status=True)
+	probe = http_downloader.probe_media(url, task.file)  # One GET both checks the type, and then downloads the media.
 
-	if stat != 200:
-		return HandlerResponse(success=False, handler=tag, failure_reason="URL Responded: %s" % stat)
-	if not ext:
+	if not probe.ok:
+		probe.close()
+		return HandlerResponse(success=False, handler=tag, failure_reason="URL Responded: %s" % probe.status)
+	if not probe.ext:
+		probe.close()
 		return False
 
 	progress.set_status("Downloading direct media...")
-	return http_downloader.download_binary(url, task.file, prog=progress, handler_id=tag)
+	return http_downloader.download_binary(url, task.file, prog=progress, handler_id=tag, probe=probe)
@@ -1,5 +1,3 @@
-# noinspection PyPackageRequirements
-from newspaper import Article, Config
 from processing.wrappers import http_downloader
 
 tag = 'newspaper'
@@ -22,6 +20,8 @@ def handle(task, progress):
 	if not resp:
 		return False
 
+	# noinspection PyPackageRequirements
+	from newspaper import Article, Config  # Imported on first use, since it is slow to load.
 	config = Config()
 	config.memoize_articles = False
 	config.verbose = False
@@ -3,7 +3,6 @@ import urllib.parse as urlp
 from os.path import splitext, basename
 from processing.handlers import HandlerResponse
 from processing.wrappers import http_downloader
-from imgurpython import ImgurClient
 from static import settings
 
 
@@ -57,6 +56,7 @@ def make_api_client():
 	client_id = settings.get('imgur.client_id')
 	client_secret = settings.get('imgur.client_secret')
 	if not _imgur_client and client_id and client_secret:
+		from imgurpython import ImgurClient
 		_imgur_client = ImgurClient(client_id, client_secret)
 	return _imgur_client
 
@@ -136,11 +136,14 @@ def handle(task, progress):
 			return HandlerResponse(success=True, handler=tag, album_urls=urls)
 
 	url = build_direct_link(url)
-	ext, stat = http_downloader.is_media_url(url, return_status=True)  # Do some pre-processing, mostly to screen filetypes.
-	if not ext or stat != 200:
+	probe = http_downloader.probe_media(url, task.file)  # Screen the filetype, with the same request used to download.
+	if not probe.ext or not probe.ok:
+		probe.close()
 		return HandlerResponse(success=False,
 							   handler=tag,
-							   failure_reason="Unable to determine imgur filetype: HTTP %s: %s" % (stat, url))
-	if ext in imgur_animation_exts:
+							   failure_reason="Unable to determine imgur filetype: HTTP %s: %s" % (probe.status, url))
+	if probe.ext in imgur_animation_exts and not url.endswith('.mp4'):
+		probe.close()  # Animations are fetched as mp4 instead, which needs a new request.
+		probe = None
 		url = '.'.join(url.split('.')[:-1]) + '.mp4'
-	return http_downloader.download_binary(url, task.file, prog=progress, handler_id=tag)
+	return http_downloader.download_binary(url, task.file, prog=progress, handler_id=tag, probe=probe)
@@ -1,7 +1,6 @@
 import re
 import html
 from collections import OrderedDict
-from lxml import html as lxhtml, etree
 from processing.handlers import HandlerResponse
 from processing.wrappers import http_downloader
 
@@ -16,6 +15,7 @@ def _iprop(ele, ele_tag, default=99999):
 
 
 def get_media_urls(base, post_id):
+	from lxml import html as lxhtml, etree
 	url = 'https://%s.tumblr.com/api/read?id=%s' % (base, post_id)
 	data = http_downloader.open_request(url, stream=False)
 	if not data or data.status_code != 200:
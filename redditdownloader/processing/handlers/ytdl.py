@@ -1,4 +1,3 @@
-import youtube_dl
 import os
 import sys
 from processing.handlers import HandlerResponse
@@ -52,10 +51,12 @@ class YTDLWrapper:
 			'outtmpl': tmp_file + '.%(ext)s',  # single_file only needs the extension.
 			'http_headers': {'User-Agent': settings.get('auth.user_agent')},
 			'socket_timeout': 10,
+			'continuedl': True,  # Resume any ".part" file left by an earlier, interrupted attempt.
 			'format': 'bestvideo+bestaudio/best',
 			'ffmpeg_location': ffmpeg_download.install_local()
 		}
 		failed = False
+		import youtube_dl  # Imported on first use, since it is slow to load.
 		try:
 			with youtube_dl.YoutubeDL(ydl_opts) as ydl:
 				self.progress.set_status("Looking for video...")
@@ -68,6 +69,8 @@ class YTDLWrapper:
 
 		# YTDL can mangle paths, so find the temp file it generated.
 		tmp_file = glob.glob('%s/**/%s.*' % (file.absolute_base(), tmp_hash), recursive=True)
+		partials = [t for t in tmp_file if _is_partial(t)]
+		tmp_file = [t for t in tmp_file if not _is_partial(t)]
 		if tmp_file:
 			for t in tmp_file:
 				self.files.add(t)
@@ -76,15 +79,23 @@ class YTDLWrapper:
 		failed = failed or not tmp_file or any(str(f).endswith('.unknown_video') for f in self.files)
 		if failed:
 			for f in self.files:
-				if os.path.isfile(f):
-					os.remove(f)
+				if os.path.isfile(f) and not _is_partial(f):
+					os.remove(f)  # Partial files are kept, so a later retry can resume them.
 			raise YTDLError("YTDL Download filetype failure.")
+		for p in partials:
+			if os.path.isfile(p):
+				os.remove(p)
 
 		file.set_ext(str(tmp_file).split(".")[-1])
 		os.rename(tmp_file, file.absolute())
 		return file
 
 
+def _is_partial(filename):
+	""" Check if the given file is one of the in-progress files YTDL can resume from. """
+	return str(filename).endswith('.part') or str(filename).endswith('.ytdl')
+
+
 # Return filename/directory name of created file(s),
 #  False if a failure is reached, or None if there was no issue, but there are no files.
 def handle(task, progress):
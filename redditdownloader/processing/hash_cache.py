@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+from static import settings
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS hashes (
+	path TEXT NOT NULL,
+	kind TEXT NOT NULL,
+	size INTEGER NOT NULL,
+	mtime INTEGER NOT NULL,
+	value TEXT,
+	PRIMARY KEY (path, kind)
+)
+"""
+
+
+class HashCache:
+	"""
+	A persistent cache of file hashes, stored in its own SQLite file so it survives manifest rebuilds.
+	Each hash is keyed by the absolute file path and the kind of hash, and is only valid while the file's size and
+	modification time are unchanged. Connections are opened lazily per Process and thread, so instances can be shared.
+	"""
+	def __init__(self, db_file):
+		self.db_file = os.path.abspath(db_file)
+		self._local = threading.local()
+
+	def _conn(self):
+		conn = getattr(self._local, 'conn', None)
+		if conn is None or self._local.pid != os.getpid():
+			os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+			conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=NORMAL')
+			conn.execute(_schema)
+			self._local.conn = conn
+			self._local.pid = os.getpid()
+		return conn
+
+	@staticmethod
+	def _key(filename):
+		path = os.path.abspath(filename)
+		st = os.stat(path)
+		return path, st.st_size, st.st_mtime_ns
+
+	def lookup(self, filename, kind, compute):
+		"""
+		Return the cached `kind` hash of the given file, or call `compute(filename)` and store its result.
+		Results of None are stored too, so files which can't be hashed a certain way are not retried.
+		:param filename: The path to the file.
+		:param kind: A name for the kind of hash, which should change whenever its algorithm does.
+		:param compute: The function which hashes the file, if there is no valid cached hash.
+		"""
+		try:
+			path, size, mtime = self._key(filename)
+		except OSError:
+			return compute(filename)
+		conn = self._conn()
+		row = conn.execute('SELECT size, mtime, value FROM hashes WHERE path = ? AND kind = ?', (path, kind)).fetchone()
+		if row and row[0] == size and row[1] == mtime:
+			return row[2]
+		value = compute(filename)
+		conn.execute('INSERT OR REPLACE INTO hashes (path, kind, size, mtime, value) VALUES (?, ?, ?, ?, ?)',
+					 (path, kind, size, mtime, value))
+		return value
+
+	def prune(self, under_dir=None):
+		""" Delete the entries for every file which no longer exists, optionally only below the given directory. Returns the count. """
+		conn = self._conn()
+		query = 'SELECT DISTINCT path FROM hashes'
+		params = ()
+		if under_dir:
+			query += ' WHERE path LIKE ? ESCAPE \'\\\''
+			prefix = os.path.join(os.path.abspath(under_dir), '')
+			params = (prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',)
+		missing = [(r[0],) for r in conn.execute(query, params) if not os.path.exists(r[0])]
+		conn.executemany('DELETE FROM hashes WHERE path = ?', missing)
+		return len(missing)
+
+	def __len__(self):
+		return self._conn().execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+	def close(self):
+		conn = getattr(self._local, 'conn', None)
+		if conn is not None and self._local.pid == os.getpid():
+			conn.close()
+		self._local.conn = None
+
+
+def get_cache_location():
+	""" The absolute path of the hash cache file in the current Settings, or None if caching is disabled. """
+	cache_file = settings.get('output.hash_cache')
+	if not cache_file:
+		return None
+	if not os.path.isabs(cache_file):
+		cache_file = os.path.join(settings.get('output.base_dir'), cache_file)
+	return os.path.abspath(cache_file)
@@ -0,0 +1,105 @@
+from collections import deque, OrderedDict
+from urllib.parse import urlparse
+import time
+
+
+def parse_overrides(text):
+	"""
+	Parse the per-host limit overrides from settings, formatted like "imgur.com=2/1, gfycat.com=3/0".
+	Each value is "max in-flight/requests per second". Malformed entries are skipped.
+	"""
+	overrides = {}
+	for entry in (text or '').split(','):
+		if '=' not in entry:
+			continue
+		host, limits = entry.split('=', 1)
+		parts = limits.split('/')
+		try:
+			in_flight = int(parts[0])
+			rps = float(parts[1]) if len(parts) > 1 else None
+		except ValueError:
+			continue
+		overrides[host.strip().lower()] = (in_flight, rps)
+	return overrides
+
+
+class _HostState:
+	def __init__(self, max_in_flight, rps):
+		self.max_in_flight = max_in_flight
+		self.rps = rps
+		self.in_flight = 0
+		self.tokens = 1.0
+		self.refilled = time.monotonic()
+		self.waiting = deque()
+
+	def refill(self, now):
+		if self.rps > 0:
+			self.tokens = min(max(1.0, self.rps), self.tokens + (now - self.refilled) * self.rps)
+		self.refilled = now
+
+	def has_capacity(self, now):
+		if not self.waiting:
+			return False
+		if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+			return False
+		if self.rps > 0:
+			self.refill(now)
+			return self.tokens >= 1
+		return True
+
+	def take(self):
+		self.in_flight += 1
+		if self.rps > 0:
+			self.tokens -= 1
+		return self.waiting.popleft()
+
+
+class HostScheduler:
+	"""
+	Holds URL IDs waiting to be downloaded, grouped by target host.
+	URLs are only released while their host is under its in-flight limit, and within its requests-per-second budget.
+	Hosts with capacity take turns, so one busy host can't starve the rest.
+	"""
+	def __init__(self, max_in_flight=0, rps=0, overrides=None):
+		self._default = (max_in_flight, rps)
+		self._overrides = overrides or {}
+		self._hosts = OrderedDict()
+		self._url_hosts = {}
+
+	def host_key(self, address):
+		""" Find the host that the given URL address should be budgeted under. """
+		host = (urlparse(address).hostname or '').lower()
+		for domain in self._overrides:
+			if host == domain or host.endswith('.' + domain):
+				return domain
+		return host[4:] if host.startswith('www.') else host
+
+	def add(self, url_id, address):
+		""" Queue the given URL ID, to be released once its host has capacity. """
+		key = self.host_key(address)
+		if key not in self._hosts:
+			in_flight, rps = self._overrides.get(key, self._default)
+			self._hosts[key] = _HostState(in_flight, self._default[1] if rps is None else rps)
+		self._hosts[key].waiting.append(url_id)
+		self._url_hosts[url_id] = key
+
+	def release(self, url_id):
+		""" Mark the given URL as finished, freeing a slot for its host. """
+		key = self._url_hosts.pop(url_id, None)
+		if key is not None and self._hosts[key].in_flight > 0:
+			self._hosts[key].in_flight -= 1
+
+	def pop_ready(self):
+		""" Yield URL IDs whose hosts have capacity, taking one from each ready host in turn. """
+		while True:
+			now = time.monotonic()
+			ready = [k for k, h in self._hosts.items() if h.has_capacity(now)]
+			if not ready:
+				return
+			for k in ready:
+				yield self._hosts[k].take()
+				self._hosts.move_to_end(k)
+
+	def pending(self):
+		""" The number of URLs still waiting to be released. """
+		return sum(len(h.waiting) for h in self._hosts.values())
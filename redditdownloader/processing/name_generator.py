@@ -3,31 +3,78 @@ from processing.wrappers.rel_file import SanitizedRelFile
 import pathvalidate
 from sql import File, URL
 from datetime import datetime
-import json
+import bisect
+import os
 
 
 _pattern_array = None
 
 
 def choose_file_name(url, post, session, album_size=1):
-	base = _choose_base_name(post).relative()
-	idx = 1
-	nb = base
-	while _get_matching(base=base, url=url, session=session):
-		idx += 1
-		base = "%s - %s" % (nb, idx)
+	"""
+	Pick a unique path for the File of the given URL, adding " - N" to its name if the path is taken.
+	A path is taken if any existing File path starts with it, except for Files in the same album as this URL.
+	The chosen path is recorded in the session's path index, so the caller is expected to create a File with it.
+	"""
+	index = _get_index(session)
+	base = index.first_free(_choose_base_name(post).relative(), url.album_id)
 	base = _add_album(url, base, album_size=album_size)
+	index.add(base, url.album_id)
 	return base
 
 
-def _get_matching(base, url, session):
-	if url.album_id:
-		aid = url.album_id
-		# Get matching bases, where they aren't from the same album.
-		return session.query(File).join(URL).filter(File.path.like(base+"%")).filter(URL.album_id != aid).first()
-	else:
-		# Get any matching base, because this isn't an album file.
-		return session.query(File).filter(File.path.like(base+"%")).first()
+def _get_index(session):
+	""" Get the path index for the given Session, loading it from the DB on first use. """
+	if 'file_path_index' not in session.info:
+		session.info['file_path_index'] = _PathIndex(session)
+	return session.info['file_path_index']
+
+
+class _PathIndex:
+	"""
+	A sorted, lower-cased list of every File path, which finds whether any path starts with a given prefix by bisection.
+	This mirrors the case-insensitive `File.path LIKE 'base%'` check, without a query for each candidate name.
+	Each path also tracks the album IDs of its URLs, so album Files only collide with Files from other albums.
+	"""
+	def __init__(self, session):
+		self._albums = {}
+		self._hints = {}
+		for path, album_id in session.query(File.path, URL.album_id).outerjoin(URL, URL.file_id == File.id):
+			self._albums.setdefault(path.lower(), set()).add(album_id)
+		self._paths = sorted(self._albums)
+
+	def add(self, path, album_id=None):
+		path = path.lower()
+		if path not in self._albums:
+			self._albums[path] = set()
+			bisect.insort(self._paths, path)
+		self._albums[path].add(album_id)
+
+	def is_taken(self, base, album_id=None):
+		""" Check if any File path starts with the given base, ignoring Files within the given album. """
+		base = base.lower()
+		i = bisect.bisect_left(self._paths, base)
+		while i < len(self._paths) and self._paths[i].startswith(base):
+			if album_id is None:
+				return True
+			if any(a is not None and a != album_id for a in self._albums[self._paths[i]]):
+				return True
+			i += 1
+		return False
+
+	def first_free(self, base, album_id=None):
+		"""
+		Find the first of `base`, `base - 2`, `base - 3`... which is not taken.
+		Paths are never removed from the index, so the search resumes from the last suffix found for the same base.
+		"""
+		key = (base.lower(), album_id)
+		idx = self._hints.get(key, 1)
+		name = base if idx == 1 else "%s - %s" % (base, idx)
+		while self.is_taken(name, album_id):
+			idx += 1
+			name = "%s - %s" % (base, idx)
+		self._hints[key] = idx
+		return name
 
 
 def _choose_base_name(post):
@@ -37,22 +84,48 @@ def _choose_base_name(post):
 	:return: The RelFile generated, with the path variables inserted and formatted.
 	"""
 	global _pattern_array
-	dct = json.loads(json.dumps(post.__dict__, default=lambda o: None))  # Deep copy, safely removing any handles/refs.
-	dct['created_date'] = datetime.fromtimestamp(dct['created_utc']).strftime('%Y-%m-%d')
-	dct['created_time'] = datetime.fromtimestamp(dct['created_utc']).strftime('%H.%M.%S')
+	values = _post_values(post)
 	if not _pattern_array:
 		file_pattern = './%s' % settings.get('output.file_name_pattern').strip('/\\ .')
-		_pattern_array = _parse_pattern(file_pattern, dct)
+		_pattern_array = _parse_pattern(file_pattern, values)
 	max_len = 200
-	length = min(max_len, max(len(str(dct[k])) for k in dct.keys()))
-	while max_len:
-		output = SanitizedRelFile(base=settings.get("output.base_dir"), file_path=_build_str(dct, length))
+	base = settings.get("output.base_dir")
+	parts = [(_filename(values[a['txt']]), True) if a['var'] else (a['txt'], False) for a in _pattern_array]
+	length = _fit_length(parts, max_len - len(os.path.abspath(base)) - 1)
+	while length >= 0:
+		output = SanitizedRelFile(base=base, file_path=_build_str(parts, length))
 		if len(output.absolute()) <= max_len:
 			return output
 		length -= 1
 	raise Exception("Unable to name file properly! Filename is likely too long!")
 
 
+def _post_values(post):
+	""" Get the pattern variables of the given Post as strings, including its formatted creation date and time. """
+	values = {k: str(v if v is None or isinstance(v, (str, int, float, bool)) else None) for k, v in post.__dict__.items()}
+	created = datetime.fromtimestamp(post.created_utc)
+	values['created_date'] = created.strftime('%Y-%m-%d')
+	values['created_time'] = created.strftime('%H.%M.%S')
+	return values
+
+
+def _fit_length(parts, max_len):
+	"""
+	Find the longest length each variable can be truncated to, while the relative path built from them fits `max_len`.
+	Since the path only grows with the length, this is a binary search. The result is an estimate of what the
+	sanitized path will need, which the caller still checks.
+	"""
+	lo, hi = 0, max([len(p) for p, var in parts if var] + [0])
+	while lo < hi:
+		mid = (lo + hi + 1) // 2
+		path = _build_str(parts, mid).strip(" ./\\\n\t\r")
+		if len(path) + path.count('%') <= max_len:
+			lo = mid
+		else:
+			hi = mid - 1
+	return lo
+
+
 def _add_album(url, file_pattern, album_size):
 	if url.album_id is not None:
 		order = str(url.album_order).rjust(len(str(album_size)), '0')
@@ -83,17 +156,14 @@ def _parse_pattern(string_in, inserts):
 	return list(filter(lambda x: x, ret))
 
 
-def _build_str(inserts, max_length=100):
-	""" Builds a string, inserting variables from the given Object. Assumes the pattern_array has been generated. """
-	if not _pattern_array:
-		raise Exception("Filename pattern array was not built!")
+def _build_str(parts, max_length=100):
+	"""
+	Builds a string from the pattern parts, a list of (text, is_var) pairs where each variable is already sanitized.
+	Each variable is truncated to `max_length`.
+	"""
 	ret = ''
-	for a in _pattern_array:
-		if a['var']:
-			ins = ''.join(_filename(str(inserts[a['txt']]))[0:max_length]).strip()
-			ret += ins
-		else:
-			ret += a['txt']
+	for p, var in parts:
+		ret += p[0:max_length].strip() if var else p
 	return ret
 
 
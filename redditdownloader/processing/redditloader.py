@@ -1,13 +1,21 @@
 from logging import debug
 import multiprocessing
 import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
 from static import settings
 from processing import name_generator
-from processing.wrappers import QueueReader, LoaderProgress
+from processing.host_scheduler import HostScheduler, parse_overrides
+from processing.wrappers import SqlQueueReader, LoaderProgress
 import sql
 
 
+def _chunks(values, size=500):
+	""" Split the given list into chunks small enough to fit within SQLite's query parameter limit. """
+	for i in range(0, len(values), size):
+		yield values[i:i + size]
+
 
 class RedditLoader(multiprocessing.Process):
 	def __init__(self, sources, settings_json, db_lock):
@@ -17,14 +25,22 @@ class RedditLoader(multiprocessing.Process):
 		super().__init__()
 		self.sources = sources
 		self.settings = settings_json
-		self._queue = multiprocessing.Queue(maxsize=2500)
 		self._open_ack = set()
+		self._scheduler = HostScheduler()
+		self._max_pending = 2500
 		self._ack_queue = multiprocessing.Queue()
 		self._stop_event = multiprocessing.Event()  # This is a shared mp.Event, set when this reader should be done.
 		self._stop_event.clear()
-		self._reader = QueueReader(input_queue=self._queue, stop_event=self._stop_event)
 		self._session = None
 		self._lock = db_lock
+		self._reader = SqlQueueReader(stop_event=self._stop_event, db_lock=self._lock)
+		self._element_buffer = []
+		self._buffer_started = None
+		self._batch_size = 1
+		self._batch_ms = 0
+		self._scan_workers = 1
+		self._recovery = iter(())
+		self._recovered = 0
 		self.progress = LoaderProgress()
 		self.daemon = True
 		self.name = 'RedditElementLoader'
@@ -45,19 +61,24 @@ class RedditLoader(multiprocessing.Process):
 		print("Started loading.") #vy
 		self.progress.set_scanning(True)
 
-		retry_failed = settings.get('processing.retry_failed')
+		self._batch_size = max(1, settings.get('processing.ingest_batch_size'))
+		self._batch_ms = max(0, settings.get('processing.ingest_batch_ms'))
+		self._scan_workers = max(1, settings.get('processing.concurrent_sources'))
+		self._scheduler = HostScheduler(
+			max_in_flight=settings.get('threading.host_max_in_flight'),
+			rps=settings.get('threading.host_requests_per_second'),
+			overrides=parse_overrides(settings.get('threading.host_limits')))
 
-		# Query for all unhandled URLs, and submit them before scanning for new Posts.
-		unfinished = self._session\
-			.query(sql.URL)\
-			.filter((sql.URL.processed == False) | \
-				(retry_failed and sql.URL.failed and \
-				 sql.not_(sql.URL.failure_reason.contains('404'))))\
-			.all()
-		print("Loading %s unfinished urls"%len(unfinished))
-		self._push_url_list(unfinished)
+		# Resume the durable work queue left by the last run.
+		# Any other unhandled URLs are recovered in small chunks, interleaved with scanning for new Posts.
+		self._reclaim_work_queue()
+		self._recovery = self._find_unfinished(settings.get('processing.retry_failed'))
+		self._recover_chunk()
 
 		self._scan_sources()
+		while self._recover_chunk():
+			pass
+		print("Recovered %s unfinished urls" % self._recovered)
 
 		self.progress.set_scanning(False)
 		# Wait for any remaining ACKS to come in, before closing the writing pipe.
@@ -68,51 +89,159 @@ class RedditLoader(multiprocessing.Process):
 		print("Elapsed time: %s"%str(datetime.now()- t_start)) #vy
 		sql.close()
 
+	def _find_unfinished(self, retry_failed, chunk_size=500):
+		"""
+		Generates lists of unhandled URLs which are not already queued, using keyset pagination over the URL ID.
+		Only the IDs and addresses are loaded, and only URLs which existed when recovery started are included.
+		"""
+		max_id = self._session.query(sql.func.max(sql.URL.id)).scalar() or 0
+		last_id = 0
+		while True:
+			chunk = self._session\
+				.query(sql.URL.id, sql.URL.address)\
+				.filter(sql.URL.id > last_id)\
+				.filter(sql.URL.id <= max_id)\
+				.filter((sql.URL.processed == False) | \
+					(retry_failed and sql.URL.failed and \
+					 sql.not_(sql.URL.failure_reason.contains('404'))))\
+				.filter(sql.not_(sql.URL.id.in_(self._session.query(sql.WorkItem.url_id))))\
+				.order_by(sql.URL.id)\
+				.limit(chunk_size)\
+				.all()
+			if not chunk:
+				return
+			last_id = chunk[-1].id
+			yield chunk
+
+	def _recover_chunk(self):
+		""" Submit the next chunk of unfinished URLs to the queue. Returns False once recovery is complete. """
+		chunk = next(self._recovery, None)
+		if not chunk:
+			return False
+		self._recovered += len(chunk)
+		self._push_url_list(chunk)
+		return True
+
 	def _scan_sources(self):
-		for source in self.sources:
-			t_start = datetime.now()
-			counter = 0
-			print("Started scanning %s"%source.get_alias())
-			try:
-				self.progress.set_source(source.get_alias())
-				for r in source.get_elements():
-					if self._stop_event.is_set():
-						print("_scan_sources says _stop_event.is_set", debug=True)
-						return
-					r.set_source(source)
-
-					counter += 1
-					# Create the SQL objects, then submit them to the queue.
-					post = self._session.query(sql.Post).filter(sql.Post.reddit_id == r.id).first()
-					with self._lock:
-						if not post:
-							post = sql.Post.convert_element_to_post(r)
-
-						urls = self._create_element_urls(r, post)
-						for u in urls:
-							self._create_url_file(u, post=post)
-						self._session.add(post)
-						self._session.commit()
-					self._push_url_list(urls)
-				print("Finished scanning %s\n  %s posts in %s"%
-						(source.get_alias(), counter, str(datetime.now()-t_start).rsplit('.',1)[0]))
-			except ConnectionError as ce:
-				print("Error while scanning %s\n  %s posts in %s"%
-						(source.get_alias(), counter, (datetime.now()-t_start)))
-				print(str(ce).upper())
-			# TODO: Log failure.
-
-	def _create_element_urls(self, reddit_element, post):
+		"""
+		Scan every Source for new RedditElements, either one at a time or several at once.
+		Scanning always happens in background threads, so this thread can flush a partial batch
+		once it is older than the batch time - even while a slow Source has nothing new to give.
+		"""
+		if not self.sources:
+			self._flush_elements()
+			return
+		elements = queue.Queue(maxsize=1000)
+
+		def emit(reddit_element):
+			while not self._stop_event.is_set():
+				try:  # The ingestion path can fall behind, so wait for room while watching for stop triggers.
+					elements.put(reddit_element, timeout=1)
+					return
+				except queue.Full:
+					pass
+
+		# With a single worker, the Sources are still scanned one at a time in their listed order.
+		with ThreadPoolExecutor(max_workers=min(self._scan_workers, len(self.sources)), thread_name_prefix='SourceScanner') as pool:
+			futures = [pool.submit(self._scan_source, source, emit) for source in self.sources]
+			while not self._stop_event.is_set():
+				try:
+					self._buffer_element(elements.get(timeout=0.1))
+				except queue.Empty:
+					if all(f.done() for f in futures) and elements.empty():
+						break
+					if self._element_buffer and self._buffer_age_ms() >= self._batch_ms:
+						self._flush_elements()
+		self._flush_elements()
+		for f in futures:
+			f.result()  # Raise any unexpected scanning errors, as scanning inline would.
+
+	def _scan_source(self, source, emit):
+		"""
+		Pass every RedditElement found by the given Source to `emit`, tagged with the Source.
+		This may run in a scanning thread, so it must not touch the DB Session.
+		"""
+		t_start = datetime.now()
+		counter = 0
+		print("Started scanning %s"%source.get_alias())
+		try:
+			self.progress.set_source(source.get_alias())
+			for r in source.get_elements():
+				if self._stop_event.is_set():
+					print("_scan_sources says _stop_event.is_set", debug=True)
+					return
+				r.set_source(source)
+
+				counter += 1
+				emit(r)
+			print("Finished scanning %s\n  %s posts in %s"%
+					(source.get_alias(), counter, str(datetime.now()-t_start).rsplit('.',1)[0]))
+		except ConnectionError as ce:
+			print("Error while scanning %s\n  %s posts in %s"%
+					(source.get_alias(), counter, (datetime.now()-t_start)))
+			print(str(ce).upper())
+		# TODO: Log failure.
+
+	def _buffer_element(self, reddit_element):
+		"""
+		Adds the given RedditElement to the ingestion buffer.
+		The buffer is flushed once it reaches the batch size, or once it has been open longer than the batch time.
+		"""
+		if not self._element_buffer:
+			self._buffer_started = datetime.now()
+		self._element_buffer.append(reddit_element)
+		if len(self._element_buffer) >= self._batch_size or self._buffer_age_ms() >= self._batch_ms:
+			self._flush_elements()
+
+	def _buffer_age_ms(self):
+		return (datetime.now() - self._buffer_started).total_seconds() * 1000
+
+	def _flush_elements(self):
+		"""
+		Creates the SQL objects for every buffered RedditElement in a single transaction,
+		then submits all of their new URLs to the queue.
+		"""
+		elements = self._element_buffer
+		self._element_buffer = []
+		self._recover_chunk()
+		if not elements:
+			return
+		posts = {}
+		for chunk in _chunks(list(set(r.id for r in elements))):
+			for p in self._session.query(sql.Post).filter(sql.Post.reddit_id.in_(chunk)):
+				posts[p.reddit_id] = p
+		known_urls = set()
+		for chunk in _chunks(list(set(u for r in elements for u in r.get_urls()))):
+			known_urls.update(a for (a,) in self._session.query(sql.URL.address).filter(sql.URL.address.in_(chunk)))
+
+		new_urls = []
+		with self._lock:
+			for r in elements:
+				post = posts.get(r.id)
+				if not post:
+					post = sql.Post.convert_element_to_post(r)
+					posts[r.id] = post
+				urls = self._create_element_urls(r, post, known_urls)
+				for u in urls:
+					self._create_url_file(u, post=post)
+				self._session.add(post)
+				new_urls.extend(urls)
+			self._session.commit()
+		self._push_url_list(new_urls)
+
+	def _create_element_urls(self, reddit_element, post, known_urls):
 		"""
 		Creates all the *new* URLS in the given RedditElement,
 		then returns a list of the new URLs.
+		`known_urls` is the set of addresses which already exist, and is updated with the new addresses.
 		"""
 		urls = []
 		for u in reddit_element.get_urls():
-			if self._session.query(sql.URL.id).filter(sql.URL.address == u).first():
+			if u in known_urls:
 				# These URLS can be skipped, because they are top-level "non-album-file" urls.
 				# Album URLs will be resubmitted submitted in a differet method.
 				continue
+			known_urls.add(u)
 			url = sql.URL.make_url(address=u, post=post, album_key=None, album_order=0)
 			urls.append(url)
 			self._session.add(url)
@@ -145,7 +274,7 @@ class RedditLoader(multiprocessing.Process):
 
 	def count_remaining(self):
 		""" Approximate the remaining elements in the queue. """
-		return self._queue.qsize()
+		return sql.session().query(sql.WorkItem).filter(sql.WorkItem.lease_owner == None).count()
 
 	def get_reader(self):
 		return self._reader
@@ -158,27 +287,63 @@ class RedditLoader(multiprocessing.Process):
 
 	def _push_url_list(self, url_list, handle_acks=True):
 		"""
-		Submits the list of URLs to the Download Queue.
+		Submits the list of URLs to the HostScheduler, which releases them to the Download Queue as their hosts allow.
 		:param url_list:
 		:param handle_acks:
 		:return:
 		"""
+		now = time.time()
+		with self._lock:
+			for u in url_list:
+				self._session.add(sql.WorkItem(url_id=u.id, host=self._scheduler.host_key(u.address), queued_at=now))
+			self._session.commit()
 		for u in url_list:
 			self.progress.increment_found()
-			while not self._stop_event.is_set():
-				try:  # Keep trying to add this element to the queue, with a timeout to catch any stop triggers.
-					self._queue.put(u.id, timeout=1)
-					self._open_ack.add(u.id)  # Replace after testing.
-					break
-				except queue.Full:
-					pass
+			self._scheduler.add(u.id, u.address)
+			self._open_ack.add(u.id)
+		self._dispatch()
 		if handle_acks and len(self._open_ack) >= 100:
 			timeout = max(1.0, min(60.0, 0.1*len(url_list)))
 			self._handle_acks(timeout=timeout)  # passively process some ACKS in a non-blocking way to prevent queue bloat.
+		while handle_acks and self._scheduler.pending() > self._max_pending and not self._stop_event.is_set():
+			self._handle_acks(timeout=1.0, clear=True)  # Too many URLs are held back by busy hosts, so wait for some to finish.
+
+	def _dispatch(self):
+		""" Release every URL whose host has capacity from the HostScheduler, so the Downloaders can claim it. """
+		ready = list(self._scheduler.pop_ready())
+		if not ready:
+			return
+		with self._lock:
+			for chunk in _chunks(ready):
+				self._session.query(sql.WorkItem)\
+					.filter(sql.WorkItem.url_id.in_(chunk))\
+					.update({'released': True}, synchronize_session=False)
+			self._session.commit()
+
+	def _reclaim_work_queue(self):
+		"""
+		Reset every lease left in the work queue by the previous run, since no Downloaders are running yet,
+		and schedule all of those URLs again in their original order.
+		"""
+		with self._lock:
+			self._session.query(sql.WorkItem)\
+				.update({'released': False, 'lease_owner': None, 'lease_expires': None}, synchronize_session=False)
+			self._session.commit()
+		rows = self._session.query(sql.WorkItem.url_id, sql.URL.address)\
+			.join(sql.URL, sql.URL.id == sql.WorkItem.url_id)\
+			.order_by(sql.WorkItem.queued_at)\
+			.all()
+		if rows:
+			print("Resuming %s queued urls" % len(rows))
+		for url_id, address in rows:
+			self.progress.increment_found()
+			self._scheduler.add(url_id, address)
+			self._open_ack.add(url_id)
+		self._dispatch()
 
 	def _handle_acks(self, timeout=0.1, clear=False):
 		"""
-		Process an Ack Packet in the queue, if there are any.
+		Process the batches of Ack Packets in the queue, if there are any.
 		If not, this method will return without blocking - unless `timeout` is set.
 		"""
 		if len(self._open_ack) == 0:
@@ -190,34 +355,56 @@ class RedditLoader(multiprocessing.Process):
 		self.progress.set_queue_size("%s acks remaining. Handling acks for %s sec ..."%(len(self._open_ack), timeout))
 		start_time = datetime.now()
 		count = 0
-		try:
-			while len(self._open_ack) > 0 and (datetime.now()-start_time).total_seconds() < timeout:
-				packet = self._ack_queue.get(block=True, timeout=timeout)
-				#print("handle_ack on packet %s"%packet, debug=True)
-				url = self._session.query(sql.URL).filter(sql.URL.id == packet.url_id).first()
-				#print("handle_ack on url %s"%url, debug=True)
-				if packet.extra_urls:
-					with self._lock:
-						urls = self._create_album_urls(packet.extra_urls, url.post, url.album_id)
-						for u in urls:
-							self._create_url_file(u, post=url.post, album_size=len(urls))
-						url.processed = True  # When the new URLs are committed, also prevent this URL from being reprocessed.
-						self._session.commit()
-					self._push_url_list(urls, handle_acks=False)
-				else:
-					with self._lock:
-						url.processed = True
-						self._session.commit()
-				self._open_ack.remove(packet.url_id)
-				count += 1
-				msg = "%s acks remaining. Currently handled %s acks in %.3f of %.1f sec."\
-						%(len(self._open_ack), count, (datetime.now()-start_time).total_seconds(), timeout)
-				self.progress.set_queue_size(msg)
-		except queue.Empty:
-			pass
+		while len(self._open_ack) > 0 and (datetime.now()-start_time).total_seconds() < timeout:
+			try:
+				# While URLs are held back by per-host rate limits, wake up often enough to release them.
+				packets = self._ack_queue.get(block=True, timeout=0.1 if self._scheduler.pending() else timeout)
+			except queue.Empty:
+				if self._scheduler.pending():
+					self._dispatch()
+					continue
+				break
+			album_urls = self._apply_acks(packets)
+			for urls in album_urls:
+				self._push_url_list(urls, handle_acks=False)
+			for packet in packets:
+				self._open_ack.discard(packet.url_id)
+				self._scheduler.release(packet.url_id)
+			self._dispatch()
+			count += len(packets)
+			msg = "%s acks remaining. Currently handled %s acks in %.3f of %.1f sec."\
+					%(len(self._open_ack), count, (datetime.now()-start_time).total_seconds(), timeout)
+			self.progress.set_queue_size(msg)
 		msg = "%s acks remaining. Last handled %s acks in %.3f of %.1f sec."\
 				%(len(self._open_ack), count, (datetime.now()-start_time).total_seconds(), timeout)
 		#print(msg, debug=True)
 		self.progress.set_queue_size(msg)
 		return
-		
\ No newline at end of file
+
+	def _apply_acks(self, packets):
+		"""
+		Mark every URL in the given batch of Ack Packets as processed, and remove them from the work queue,
+		in a single transaction. Album URLs are created for any packets which found them.
+		:return: A list containing the list of new Album URLs for each Album, to be queued.
+		"""
+		ids = [p.url_id for p in packets]
+		album_urls = []
+		with self._lock:
+			for packet in packets:
+				if not packet.extra_urls:
+					continue
+				url = self._session.query(sql.URL).filter(sql.URL.id == packet.url_id).first()
+				urls = self._create_album_urls(packet.extra_urls, url.post, url.album_id)
+				for u in urls:
+					self._create_url_file(u, post=url.post, album_size=len(urls))
+				album_urls.append(urls)
+			# When the new URLs are committed, also prevent the acked URLs from being reprocessed.
+			for chunk in _chunks(ids):
+				self._session.query(sql.URL)\
+					.filter(sql.URL.id.in_(chunk))\
+					.update({'processed': True}, synchronize_session=False)
+				self._session.query(sql.WorkItem)\
+					.filter(sql.WorkItem.url_id.in_(chunk))\
+					.delete(synchronize_session=False)
+			self._session.commit()
+		return album_urls
@@ -1,8 +1,9 @@
 import json
 from logging import debug
 import multiprocessing
-from processing.wrappers.rel_file import RelFile, SanitizedRelFile
+from processing.wrappers.rel_file import RelFile, SanitizedRelFile, stat_files
 from processing.wrappers.queue_reader import QueueReader
+from processing.wrappers.sql_queue_reader import SqlQueueReader
 from multiprocessing import Array
 import ctypes
 
@@ -23,9 +24,12 @@ class Progress:
 
 	def __init__(self, field_size=200):
 		self.field_size = field_size
-		self.fields = {f: Array(ctypes.c_char, self.field_size) for f in self.get_fields()}
+		self.fields = {f: self._new_field() for f in self.get_fields()}
 		self.clear()
 
+	def _new_field(self):
+		return Array(ctypes.c_char, self.field_size)
+
 	def clear(self):
 		pass
 
@@ -99,6 +103,25 @@ class DownloaderProgress(Progress):
 		return ['percent', 'status', 'handler', 'running', 'file_name', 'error']
 
 
+class TaskProgress(DownloaderProgress):
+	"""
+	A Process-local DownloaderProgress, which keeps its values in a plain dict instead of shared memory.
+	This lets many concurrent downloads within one Process each report progress, without allocating shared Arrays.
+	"""
+	def __init__(self):
+		super().__init__()
+
+	def _new_field(self):
+		return None
+
+	def set(self, field, value):
+		self.fields[field] = value
+		return True
+
+	def get(self, field):
+		return self.fields.get(field)
+
+
 class LoaderProgress(Progress):
 	def __init__(self):
 		super().__init__()
@@ -1,11 +1,71 @@
 import requests
+from requests.adapters import HTTPAdapter
 import mimetypes
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from static import settings
 from processing.handlers import HandlerResponse
 import multiprocessing
 
 
 allowed_mimetypes = ('image/', 'audio/', 'video/')
+_unknown_mimetypes = ('', 'application/octet-stream', 'binary/octet-stream')
+_sniff_size = 64
+_media_signatures = (
+	(0, b'\xff\xd8\xff', 'jpg'),
+	(0, b'\x89PNG\r\n\x1a\n', 'png'),
+	(0, b'GIF87a', 'gif'),
+	(0, b'GIF89a', 'gif'),
+	(8, b'WEBP', 'webp'),
+	(4, b'ftyp', 'mp4'),
+	(0, b'\x1a\x45\xdf\xa3', 'webm'),
+	(0, b'OggS', 'ogg'),
+	(0, b'ID3', 'mp3'),
+)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+	"""
+	Get the pooled, keep-alive requests Session for this Process.
+	Each Process builds its own Session the first time it needs one, which is then shared by every Handler.
+	"""
+	global _session, _session_pid
+	with _session_lock:
+		if _session is None or _session_pid != os.getpid():
+			pool_size = max(1, settings.get('threading.http_pool_size'))
+			adapter = HTTPAdapter(pool_connections=20, pool_maxsize=pool_size)
+			sess = requests.Session()
+			sess.mount('http://', adapter)
+			sess.mount('https://', adapter)
+			_session = sess
+			_session_pid = os.getpid()
+		return _session
+
+
+def connection_stats():
+	"""
+	Count the requests this Process has sent, and how many new connections they needed.
+	Only hosts which still have an open connection pool are counted.
+	:return: A dict of {'requests', 'connections', 'reused'} counts.
+	"""
+	stats = {'requests': 0, 'connections': 0}
+	if _session is not None and _session_pid == os.getpid():
+		for adapter in set(_session.adapters.values()):
+			pools = adapter.poolmanager.pools
+			for key in pools.keys():
+				pool = pools[key]
+				stats['requests'] += pool.num_requests
+				stats['connections'] += pool.num_connections
+	stats['reused'] = max(0, stats['requests'] - stats['connections'])
+	return stats
 
 
 def _req_args():
@@ -17,14 +77,17 @@ def _req_args():
 	}
 
 
-def open_request(url, stream=True):
-	return requests.get(url, **_req_args(), stream=stream)
+def open_request(url, stream=True, headers=None):
+	args = _req_args()
+	if headers:
+		args['headers'].update(headers)
+	return get_session().get(url, **args, stream=stream)
 
 
 def is_media_url(url, return_status=False):
 	ret = (None, None)
 	try:
-		r = requests.head(url, **_req_args())
+		r = get_session().head(url, **_req_args())
 		if not r or r.status_code != 200:
 			ret = (None, r.status_code)
 		else:
@@ -51,47 +114,282 @@ def _guess_media_mimetype(req):
 	return ext
 
 
-def download_binary(url, rel_file, prog, handler_id):
+class PartialDownload:
+	"""
+	Tracks the ".part" file for an unfinished download, which is kept next to the target RelFile between attempts.
+	A small JSON file beside it records the URL, extension, and the server's validator (ETag/Last-Modified),
+	so a later attempt can resume from the current byte offset with an HTTP Range request.
+	"""
+	def __init__(self, rel_file):
+		self.path = rel_file.absolute() + '.part'
+		self.meta_path = self.path + '.json'
+		self.meta = {}
+		# noinspection PyBroadException
+		try:
+			with open(self.meta_path, 'r') as o:
+				self.meta = json.load(o)
+		except Exception:
+			pass
+
+	def offset(self):
+		""" The number of bytes already downloaded, which is zero unless the download can be resumed. """
+		if not self.meta.get('validator') or not os.path.isfile(self.path):
+			return 0
+		return os.path.getsize(self.path)
+
+	def resume_headers(self, url):
+		""" Build the headers needed to resume the given URL, or None if it can't be resumed. """
+		if self.meta.get('url') != url or not self.offset():
+			return None
+		return {'Range': 'bytes=%s-' % self.offset(), 'If-Range': self.meta['validator']}
+
+	def start(self, url, req, ext, resume):
+		""" Record the details needed to resume this download, and open the part file for writing. """
+		self.meta = {
+			'url': url,
+			'ext': ext,
+			'validator': req.headers.get('etag') or req.headers.get('last-modified'),
+			'offset': self.offset() if resume else 0
+		}
+		with open(self.meta_path, 'w') as o:
+			json.dump(self.meta, o)
+		return open(self.path, 'ab' if resume else 'wb')
+
+	def hash_existing(self):
+		""" Start a SHA1 hash with the bytes already in the part file, so a resumed download can continue it. """
+		sha1 = hashlib.sha1()
+		with open(self.path, 'rb') as o:
+			for b in iter(lambda: o.read(1024*1024), b''):
+				sha1.update(b)
+		return sha1
+
+	def allocate(self, size):
+		""" Create a part file of the given size, to be filled in by segments. This file is never resumed. """
+		self.discard()
+		with open(self.path, 'wb') as o:
+			o.truncate(size)
+
+	def finish(self, rel_file):
+		""" Move the completed part file into place at the given RelFile. """
+		os.replace(self.path, rel_file.absolute())
+		self.clear_meta()
+
+	def abort(self):
+		""" Handle a failed download. The part file is kept if it can be resumed later, or deleted if not. """
+		if self.offset() and os.path.isfile(self.meta_path):
+			self.meta['offset'] = self.offset()
+			with open(self.meta_path, 'w') as o:
+				json.dump(self.meta, o)
+			return
+		self.discard()
+
+	def discard(self):
+		""" Delete the part file, and everything recorded about it. """
+		if os.path.isfile(self.path):
+			os.remove(self.path)
+		self.clear_meta()
+		self.meta = {}
+
+	def clear_meta(self):
+		if os.path.isfile(self.meta_path):
+			os.remove(self.meta_path)
+
+
+class MediaProbe:
+	"""
+	A single open, streaming GET request to a URL which might be media.
+	The headers (and, if needed, the first bytes) have been checked, but the rest of the body has not been read.
+	If the request resumes a PartialDownload, `offset` is the byte position the body starts at.
+	"""
+	def __init__(self, url, req, ext=None, head=b'', error=None, partial=None, offset=0):
+		self.url = url
+		self.req = req
+		self.ext = ext
+		self.head = head
+		self.error = error
+		self.partial = partial
+		self.offset = offset
+
+	@property
+	def status(self):
+		return self.req.status_code if self.req is not None else None
+
+	@property
+	def ok(self):
+		return self.status == 200 or (self.status == 206 and self.offset > 0)
+
+	def close(self):
+		if self.req is not None:
+			self.req.close()
+
+
+def probe_media(url, rel_file=None):
+	"""
+	Open one streaming GET for the given URL, and decide if it is media from the response.
+	If the server does not send a useful Content-Type, the first bytes of the body are sniffed instead.
+	If `rel_file` is given, and an earlier attempt left a resumable part file for it, the GET resumes with a Range.
+
+	The returned MediaProbe should either be passed on to `download_binary`, or closed.
+	"""
+	partial = PartialDownload(rel_file) if rel_file else None
+	headers = partial.resume_headers(url) if partial else None
+	try:
+		req = open_request(url, stream=True, headers=headers)
+	except Exception as ex:
+		print(ex)
+		return MediaProbe(url, None, error=ex, partial=partial)
+	if headers and req.status_code in (206, 416):
+		offset = _range_start(req) if req.status_code == 206 else None
+		if offset != partial.offset():
+			req.close()
+			partial.discard()  # The part file can't be resumed from here, so start again from the beginning.
+			return probe_media(url, rel_file)
+		ext = _guess_media_mimetype(req) or partial.meta.get('ext')
+		return MediaProbe(url, req, ext=ext, partial=partial, offset=offset)
+	if req.status_code != 200:
+		return MediaProbe(url, req, partial=partial)
+	ext = _guess_media_mimetype(req)
+	head = b''
+	if not ext and req.headers.get('content-type', '').split(';')[0].strip() in _unknown_mimetypes:
+		head = req.raw.read(_sniff_size, decode_content=True)
+		ext = _sniff_media_ext(head)
+	return MediaProbe(url, req, ext=ext, head=head, partial=partial)
+
+
+def _range_start(req):
+	""" Read the first byte position from a 206 response's Content-Range header, or None if it is missing. """
+	match = re.match(r'bytes\s+(\d+)-', req.headers.get('content-range', ''))
+	return int(match.group(1)) if match else None
+
+
+def _sniff_media_ext(head):
+	""" Guess the extension of a media file from its first bytes, or None if it isn't recognized. """
+	for offset, magic, ext in _media_signatures:
+		if head[offset:offset + len(magic)] == magic:
+			if ext == 'webp' and head[:4] != b'RIFF':
+				continue
+			return ext
+	return None
+
+
+def download_binary(url, rel_file, prog, handler_id, probe=None):
 	"""
 	Downloads the given URL into a binary file, updating the provided status as it goes.
+	The data is written to a ".part" file first, which is kept (and resumed next time) if the download is interrupted.
 
 	:param url: The URL to download
 	:param rel_file: The RelFile to save to
 	:param prog: The progress object to update.
 	:param handler_id: The ID of the controlling Handler, for printout & Errors.
+	:param probe: An already-open MediaProbe for this URL, if the Handler has one. Otherwise, one is opened.
 	:return: a HandlerResponse object, with the download outcome.
 	"""
+	partial = None
 	# noinspection PyBroadException
 	try:
-		req = open_request(url, stream=True)
-		if not req or req.status_code != 200:
+		if probe is None:
+			probe = probe_media(url, rel_file)
+		partial = probe.partial or PartialDownload(rel_file)
+		req = probe.req
+		if probe.error:
+			raise probe.error
+		if not req or not probe.ok:
+			partial = None  # Nothing was written, so leave any existing part file for the next attempt.
 			return HandlerResponse(success=False,
 								   handler=handler_id,
 								   failure_reason="Server Error: %s->%s" % (url, req.status_code if req is not None else None))
 		size = req.headers.get('content-length')
 		if size:
-			size = int(size)
-		downloaded_size = 0
+			size = int(size) + probe.offset
+		downloaded_size = probe.offset
 
-		ext = _guess_media_mimetype(req)
+		ext = probe.ext
 		if not ext:
+			partial = None
 			return HandlerResponse(success=False, handler=handler_id, failure_reason="Unable to determine MIME Type.")
 		rel_file.set_ext(ext)
 		rel_file.mkdirs()
-		prog.set_status("Downloading file...")
+		prog.set_status("Downloading file..." if not probe.offset else "Resuming download at %s bytes..." % probe.offset)
 		prog.set_file(rel_file.relative())
-		with open(rel_file.absolute(), 'wb') as f:
+		if _use_segments(probe, size):
+			probe.close()
+			_download_segments(url, req, size, partial, prog)
+			partial.finish(rel_file)
+			partial = None
+			return HandlerResponse(success=True, rel_file=rel_file, handler=handler_id, size=size)
+		# The file is hashed as it is written, so it never needs to be read again just to find its SHA1.
+		sha1 = partial.hash_existing() if probe.offset else hashlib.sha1()
+		with partial.start(url, req, ext, resume=probe.offset > 0) as f:
+			if probe.head:
+				downloaded_size += len(probe.head)
+				f.write(probe.head)
+				sha1.update(probe.head)
 			for data in req.iter_content(chunk_size=1024*1024*4):
 				downloaded_size += len(data)
 				f.write(data)
+				sha1.update(data)
 				if size:
 					prog.set_percent(round(100*(downloaded_size/size)))
-		return HandlerResponse(success=True, rel_file=rel_file, handler=handler_id)
+		partial.finish(rel_file)
+		partial = None
+		return HandlerResponse(success=True, rel_file=rel_file, handler=handler_id, sha1=sha1.hexdigest(), size=downloaded_size)
 	except Exception as ex:
 		print(ex)
-		if rel_file.exists():
-			rel_file.delete_file()
+		if partial:
+			partial.abort()
 		return HandlerResponse(success=False, handler=handler_id, failure_reason="Error Downloading: %s" % ex)
+	finally:
+		if probe is not None:
+			probe.close()
+
+
+def _use_segments(probe, size):
+	""" Check if this fresh download is large enough, and the server supports byte ranges, to fetch it in segments. """
+	threshold = settings.get('threading.segmented_download_mb')
+	if not size or probe.offset or probe.head or threshold <= 0 or settings.get('threading.download_segments') < 2:
+		return False
+	return size >= threshold * 1024 * 1024 and probe.req.headers.get('accept-ranges', '').lower() == 'bytes'
+
+
+def _download_segments(url, req, size, partial, prog):
+	"""
+	Download the file in several byte ranges at once, each written into its place in a preallocated part file.
+	Raises an Exception if any segment fails, so the incomplete file can be discarded.
+	"""
+	count = settings.get('threading.download_segments')
+	seg_size = -(-size // count)
+	ranges = [(start, min(start + seg_size, size) - 1) for start in range(0, size, seg_size)]
+	validator = req.headers.get('etag') or req.headers.get('last-modified')
+	done = [0]
+	lock = threading.Lock()
+	partial.allocate(size)
+
+	def fetch(start, end):
+		headers = {'Range': 'bytes=%s-%s' % (start, end)}
+		if validator:
+			headers['If-Range'] = validator
+		seg = open_request(url, stream=True, headers=headers)
+		try:
+			if seg.status_code != 206 or _range_start(seg) != start:
+				raise Exception("Server did not return the requested range: %s->%s" % (url, seg.status_code))
+			with open(partial.path, 'r+b') as f:
+				f.seek(start)
+				for data in seg.iter_content(chunk_size=1024*256):
+					data = data[:end + 1 - f.tell()]  # Never write past the end of this segment.
+					f.write(data)
+					with lock:
+						done[0] += len(data)
+						prog.set_percent(round(100*(done[0]/size)))
+				if f.tell() != end + 1:
+					raise Exception("Segment ended early: %s (%s-%s)" % (url, start, end))
+		finally:
+			seg.close()
+
+	prog.set_status("Downloading file in %s segments..." % len(ranges))
+	with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+		futures = [pool.submit(fetch, start, end) for start, end in ranges]
+		for fut in futures:
+			fut.result()
 
 
 def page_text(url, json=False):
@@ -6,6 +6,7 @@ import os.path as op
 import os
 import pathvalidate
 import hashlib
+import stat
 import static.filesystem as fs
 
 
@@ -14,6 +15,12 @@ class RelError(Exception):
 
 
 class RelFile:
+	"""
+	A path relative to a base directory. Its absolute and relative forms are computed once and cached,
+	and are only recomputed if the extension is changed by `set_ext`.
+	"""
+	__slots__ = ('_base', '_path', '_abs', '_rel')
+
 	def __init__(self, base, file_path=None, full_file_path=None):
 		base = op.abspath(base)
 		if full_file_path:
@@ -25,8 +32,10 @@ class RelFile:
 		join_test = op.abspath(op.abspath(op.join(base, file_path)))
 		if not fs.is_subpath(base, join_test):
 			raise RelError("The relative path cannot elevate above the Base Parent: {%s -> %s}" % (file_path, join_test))
-		self._base = op.abspath(base)
+		self._base = base
 		self._path = self._norm(file_path)
+		self._abs = None
+		self._rel = None
 
 	def _norm(self, path):
 		"""
@@ -35,13 +44,17 @@ class RelFile:
 		return op.normpath(path).replace("\\", "/")
 
 	def absolute(self):
-		return self._norm(op.abspath(op.join(self._base, self._path)))
+		if self._abs is None:
+			self._abs = self._norm(op.abspath(op.join(self._base, self._path)))
+		return self._abs
 
 	def relative(self):
 		"""
 		Get the relative path of this File, ignoring the base.
 		"""
-		return self._norm(self._path)
+		if self._rel is None:
+			self._rel = self._norm(self._path)
+		return self._rel
 
 	def exists(self):
 		return op.exists(self.absolute())
@@ -50,9 +63,11 @@ class RelFile:
 		return op.isfile(self.absolute())
 
 	def size(self):
-		if not self.is_file():
+		try:
+			st = os.stat(self.absolute())
+		except OSError:
 			return 0
-		return op.getsize(self.absolute())
+		return st.st_size if stat.S_ISREG(st.st_mode) else 0
 
 	def delete_file(self, recursive_cleanup=True):
 		if recursive_cleanup:
@@ -77,6 +92,8 @@ class RelFile:
 		if not ext:
 			ext = '.unknown'
 		self._path += '.%s' % ext
+		self._abs = None
+		self._rel = None
 
 	def mkdirs(self):
 		"""
@@ -92,6 +109,8 @@ class RelFile:
 
 
 class SanitizedRelFile(RelFile):
+	__slots__ = ()
+
 	def __init__(self, base, file_path=None, full_file_path=None):
 		super().__init__(base, file_path, full_file_path)
 		self._path = self._path.replace('%', '%%')
@@ -108,3 +127,38 @@ class SanitizedRelFile(RelFile):
 			path = path.replace('./', '/')
 			path = path.replace('/.', '/')
 		return path
+
+
+def stat_files(rel_files, min_batch=16):
+	"""
+	Find which of the given RelFiles exist as regular files, and their sizes, grouping them by directory.
+	Directories holding at least `min_batch` of the files are read with a single `os.scandir`, instead of checking
+	each file separately. Smaller groups are checked one by one, since listing a large directory to find a few files
+	would be slower.
+	:return: A dict of {absolute path: size in bytes}, containing only the files which exist.
+	"""
+	by_dir = {}
+	for rf in rel_files:
+		path = rf.absolute()
+		by_dir.setdefault(op.dirname(path), set()).add(path)
+	found = {}
+	for directory, paths in by_dir.items():
+		if len(paths) < min_batch:
+			for path in paths:
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				if stat.S_ISREG(st.st_mode):
+					found[path] = st.st_size
+			continue
+		try:
+			entries = os.scandir(directory)
+		except OSError:
+			continue
+		with entries:
+			for e in entries:
+				path = '%s/%s' % (directory.rstrip('/'), e.name)
+				if path in paths and e.is_file():
+					found[path] = e.stat().st_size
+	return found
@@ -0,0 +1,99 @@
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+import sql
+
+
+class SqlQueueReader:
+	"""
+	A drop-in replacement for the QueueReader, which claims URL IDs from the durable `work_queue` table.
+	Each claim is a lease owned by the reading Process, kept alive by a background heartbeat while it runs.
+	If a Process dies, its leases expire and the URLs become available to claim again.
+	Instances of this class should be safe to share cross-Process; all state is created lazily in the reader.
+	"""
+	def __init__(self, stop_event, db_lock, lease_seconds=120, heartbeat_seconds=30, poll_seconds=.2):
+		"""
+		:param stop_event: The multiprocessing.Event, which will tell this reader to stop reading.
+		:param db_lock: The multiprocessing Lock shared by everything that writes to the DB.
+		"""
+		self._stop_event = stop_event
+		self._db_lock = db_lock
+		self.lease_seconds = lease_seconds
+		self.heartbeat_seconds = heartbeat_seconds
+		self.poll_seconds = poll_seconds
+		self._owner = None
+		self._owner_pid = None
+		self._heartbeat = None
+
+	def owner(self):
+		""" The unique lease owner name for the current Process. """
+		if self._owner_pid != os.getpid():
+			self._owner_pid = os.getpid()
+			self._owner = '%s-%s-%s' % (socket.gethostname(), self._owner_pid, uuid.uuid4().hex[:8])
+			self._heartbeat = None
+		return self._owner
+
+	def claim(self):
+		""" Lease the oldest released URL that is not already leased, and return its ID - or None if there are none. """
+		owner = self.owner()
+		sess = sql.session()
+		now = time.time()
+		with self._db_lock:
+			item = sess.query(sql.WorkItem)\
+				.filter(sql.WorkItem.released == True)\
+				.filter((sql.WorkItem.lease_owner == None) | (sql.WorkItem.lease_expires < now))\
+				.order_by(sql.WorkItem.queued_at)\
+				.first()
+			if not item:
+				sess.commit()
+				return None
+			item.lease_owner = owner
+			item.lease_expires = now + self.lease_seconds
+			item.heartbeat = now
+			item.attempts += 1
+			url_id = item.url_id
+			sess.commit()
+		self._start_heartbeat()
+		return url_id
+
+	def _start_heartbeat(self):
+		if self._heartbeat is None:
+			self._heartbeat = threading.Thread(target=self._beat, name='WorkQueueHeartbeat', daemon=True)
+			self._heartbeat.start()
+
+	def _beat(self):
+		""" Extend every lease this Process holds, until the reader is stopped. """
+		owner = self.owner()
+		sess = sql.session()
+		while not self._stop_event.wait(self.heartbeat_seconds):
+			now = time.time()
+			with self._db_lock:
+				sess.query(sql.WorkItem)\
+					.filter(sql.WorkItem.lease_owner == owner)\
+					.update({'heartbeat': now, 'lease_expires': now + self.lease_seconds}, synchronize_session=False)
+				sess.commit()
+
+	def next(self, hang=True):
+		"""
+		Claims the next URL ID in the work queue, if there is one. Hangs until one is available.
+		:param hang: If False, throws a queue.Empty exception. Default True.
+		:return: The next URL ID, or None if loading is finished.
+		"""
+		while not self._stop_event.is_set():
+			nxt = self.claim()
+			if nxt is not None:
+				return nxt
+			if not hang:
+				raise queue.Empty()
+			self._stop_event.wait(self.poll_seconds)
+		return None
+
+	def __iter__(self):
+		while True:
+			n = self.next(hang=True)
+			if n is None:
+				break
+			yield n
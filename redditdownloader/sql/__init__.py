@@ -5,6 +5,7 @@ Its objects should not be shared across Processes or Threads.
 """
 
 import json
+import re
 import traceback
 
 import sqlalchemy
@@ -12,9 +13,9 @@ from alembic import command
 from alembic import script
 from alembic.config import Config
 from alembic.runtime import migration
-from sqlalchemy import or_, not_, and_
+from sqlalchemy import or_, not_, and_, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker, scoped_session, selectinload
 import os
 import shutil
 import sys
@@ -164,6 +165,8 @@ def _check_legacy(sess):
 from sql.file import File, Hash
 from sql.post import Post
 from sql.url import URL
+from sql.work_queue import WorkItem
+from sql.stat import Stat
 
 
 class Searcher:
@@ -185,22 +188,71 @@ class Searcher:
 		return conds
 
 
+_posts_fts = sqlalchemy.table('posts_fts', sqlalchemy.column('rowid'), sqlalchemy.column('rank'))
+
+
 class PostSearcher(Searcher):
+	# The Post fields covered by the posts_fts full-text index.
+	indexed_fields = ['author', 'type', 'title', 'body', 'subreddit', 'source_alias']
+
 	def __init__(self, current_session):
 		super().__init__(Post)
 		self.session = current_session
+		self._has_index = None
+
+	def has_index(self):
+		""" Check if the manifest has a full-text index, which it won't if SQLite was built without FTS5. """
+		if self._has_index is None:
+			self._has_index = self.session.execute(
+				"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'").first() is not None
+		return self._has_index
+
+	def match_expression(self, fields, term):
+		"""
+		Build a full-text query, matching Posts where every word of the term starts a word in any of the given fields.
+		Returns None if the index can't answer the search, in which case the slower LIKE conditions are used.
+		"""
+		words = re.findall(r'\w+', str(term))
+		fields = [f for f in fields if f in self.get_searchable_fields()]
+		if not words or not fields or any(f not in self.indexed_fields for f in fields) or not self.has_index():
+			return None
+		return '{%s} : (%s)' % (' '.join(fields), ' '.join('"%s"*' % w for w in words))
+
+	def search_query(self, fields, term):
+		"""
+		Build a Query for the Posts with any of the given fields matching the given term, best matches first.
+		Only Posts with at least one finished URL that has a File are included, each one only once.
+		"""
+		match = self.match_expression(fields, term)
+		query = self.session\
+			.query(Post)\
+			.filter(Post.urls.any(and_(URL.processed != False, URL.failed != True, URL.file.has())))
+		if match:
+			return query\
+				.join(_posts_fts, _posts_fts.c.rowid == sqlalchemy.literal_column('posts.rowid'))\
+				.filter(sqlalchemy.text('posts_fts MATCH :match').bindparams(match=match))\
+				.order_by(_posts_fts.c.rank, sqlalchemy.literal_column('posts.rowid'))
+		return query\
+			.filter(or_(*self.search_field_conditions(fields, term)))\
+			.order_by(sqlalchemy.literal_column('posts.rowid'))
 
 	def search_fields(self, fields, term):
-		""" Search for Posts with any of the given fields matching the given term. """
-		conds = self.search_field_conditions(fields, term)
-		return self.session\
-			.query(Post)\
-			.join(URL)\
-			.join(File)\
-			.filter(or_(*conds)) \
-			.filter((URL.processed != False))\
-			.filter(URL.failed != True)\
+		""" Search for Posts with any of the given fields matching the given term, best matches first. """
+		return self.search_query(fields, term).all()
+
+	def search_page(self, fields, term, page_size, page):
+		"""
+		Search for a single page of matching Posts, with their URLs and Files loaded up front.
+		:return: A tuple of (total matching Posts, the Posts on this page).
+		"""
+		query = self.search_query(fields, term)
+		total = query.order_by(None).count()
+		posts = query\
+			.options(selectinload(Post.urls).joinedload(URL.file))\
+			.limit(page_size)\
+			.offset(max(0, page) * page_size)\
 			.all()
+		return total, posts
 
 
 def _iterable(obj):
@@ -242,6 +294,12 @@ def encode_safe(obj, stringify=False, indent=None):
 		obj = json.dumps(obj, indent=indent)
 	return obj
 
+def get_stats(sess=None):
+	""" Get every manifest counter from the stats table, as a dict of {name: value}. """
+	sess = sess or session()
+	return {name: value for name, value in sess.query(Stat.name, Stat.value)}
+
+
 def get_last_seen_posts(username, limit, before_utc=0):
 	out = []
 	for p in _Session.query(Post).filter(Post.author==username).order_by(Post.created_utc.desc()):
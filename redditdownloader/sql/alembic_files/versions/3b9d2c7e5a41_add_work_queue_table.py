@@ -0,0 +1,44 @@
+"""Add the work_queue table, a durable queue of URLs waiting to be downloaded.
+
+Revision ID: 3b9d2c7e5a41
+Revises: 6f8cfc06eaa3
+Create Date: 2026-10-18 10:12:31.118274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d2c7e5a41'
+down_revision = '6f8cfc06eaa3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('work_queue',
+    sa.Column('url_id', sa.Integer(), nullable=False),
+    sa.Column('host', sa.String(), nullable=True),
+    sa.Column('queued_at', sa.Float(), nullable=False),
+    sa.Column('released', sa.Boolean(), nullable=False),
+    sa.Column('lease_owner', sa.String(), nullable=True),
+    sa.Column('lease_expires', sa.Float(), nullable=True),
+    sa.Column('heartbeat', sa.Float(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['url_id'], ['urls.id'], ),
+    sa.PrimaryKeyConstraint('url_id')
+    )
+    with op.batch_alter_table('work_queue', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_work_queue_queued_at'), ['queued_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_work_queue_released'), ['released'], unique=False)
+        batch_op.create_index(batch_op.f('ix_work_queue_lease_owner'), ['lease_owner'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('work_queue', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_work_queue_lease_owner'))
+        batch_op.drop_index(batch_op.f('ix_work_queue_released'))
+        batch_op.drop_index(batch_op.f('ix_work_queue_queued_at'))
+
+    op.drop_table('work_queue')
@@ -0,0 +1,39 @@
+"""Add an integer dhash column to the Hash table, for near-duplicate image searches.
+
+Revision ID: 8e4a1f6c2d07
+Revises: 3b9d2c7e5a41
+Create Date: 2026-10-18 11:02:47.503912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4a1f6c2d07'
+down_revision = '3b9d2c7e5a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('hashes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dhash', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_hashes_dhash'), ['dhash'], unique=False)
+
+    conn = op.get_bind()
+    res = conn.execute("select id, full_hash from hashes WHERE length(full_hash) = 16")
+    for row in res.fetchall():
+        conn.execute('UPDATE hashes SET dhash = ? WHERE id = ?', (to_dhash_int(row[1]), row[0]))
+
+
+def downgrade():
+    with op.batch_alter_table('hashes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_hashes_dhash'))
+        batch_op.drop_column('dhash')
+
+
+def to_dhash_int(hash_string):
+    """ Convert the given 16-character hex hash into a signed 64-bit integer, to fit in SQLite. """
+    value = int(hash_string, 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
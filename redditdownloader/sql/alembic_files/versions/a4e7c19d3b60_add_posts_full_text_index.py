@@ -0,0 +1,60 @@
+"""Add an FTS5 full-text index over the searchable Post fields, kept in sync by triggers.
+
+Revision ID: a4e7c19d3b60
+Revises: d9a3b6e18f52
+Create Date: 2026-10-18 14:02:31.417820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e7c19d3b60'
+down_revision = 'd9a3b6e18f52'
+branch_labels = None
+depends_on = None
+
+# The index reads its content from the posts table, by rowid.
+# Any later migration which rebuilds the posts table must recreate these triggers, and rebuild the index.
+_columns = ['author', 'type', 'title', 'body', 'subreddit', 'source_alias']
+
+
+def _values(prefix):
+    return ', '.join('%s.%s' % (prefix, c) for c in _columns)
+
+
+def _fts5_available(conn):
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.fts5_check USING fts5(x)')
+        conn.execute('DROP TABLE temp.fts5_check')
+        return True
+    except sa.exc.OperationalError:
+        return False
+
+
+def upgrade():
+    conn = op.get_bind()
+    if not _fts5_available(conn):
+        # Searching falls back to LIKE queries without the index.
+        return
+    cols = ', '.join(_columns)
+    conn.execute("CREATE VIRTUAL TABLE posts_fts USING fts5(%s, content='posts', content_rowid='rowid')" % cols)
+    conn.execute(
+        'CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN '
+        'INSERT INTO posts_fts(rowid, %s) VALUES (new.rowid, %s); END' % (cols, _values('new')))
+    conn.execute(
+        'CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN '
+        "INSERT INTO posts_fts(posts_fts, rowid, %s) VALUES ('delete', old.rowid, %s); END" % (cols, _values('old')))
+    conn.execute(
+        'CREATE TRIGGER posts_fts_update AFTER UPDATE ON posts BEGIN '
+        "INSERT INTO posts_fts(posts_fts, rowid, %s) VALUES ('delete', old.rowid, %s); "
+        'INSERT INTO posts_fts(rowid, %s) VALUES (new.rowid, %s); END' % (cols, _values('old'), cols, _values('new')))
+    conn.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    conn = op.get_bind()
+    for trigger in ['posts_fts_insert', 'posts_fts_delete', 'posts_fts_update']:
+        conn.execute('DROP TRIGGER IF EXISTS %s' % trigger)
+    conn.execute('DROP TABLE IF EXISTS posts_fts')
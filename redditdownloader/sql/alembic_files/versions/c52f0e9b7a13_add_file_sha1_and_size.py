@@ -0,0 +1,28 @@
+"""Add sha1 and size columns to the File table, recorded while downloading.
+
+Revision ID: c52f0e9b7a13
+Revises: 8e4a1f6c2d07
+Create Date: 2026-10-18 11:41:09.227160
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52f0e9b7a13'
+down_revision = '8e4a1f6c2d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sha1', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('size', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_column('size')
+        batch_op.drop_column('sha1')
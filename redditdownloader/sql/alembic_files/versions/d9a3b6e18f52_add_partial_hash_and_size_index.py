@@ -0,0 +1,34 @@
+"""Add a partial_hash column to the Hash table, and index File sizes, for staged duplicate detection.
+
+Revision ID: d9a3b6e18f52
+Revises: c52f0e9b7a13
+Create Date: 2026-10-18 12:20:55.861034
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a3b6e18f52'
+down_revision = 'c52f0e9b7a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('hashes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('partial_hash', sa.String(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_hashes_partial_hash'), ['partial_hash'], unique=False)
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_files_size'), ['size'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_files_size'))
+
+    with op.batch_alter_table('hashes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_hashes_partial_hash'))
+        batch_op.drop_column('partial_hash')
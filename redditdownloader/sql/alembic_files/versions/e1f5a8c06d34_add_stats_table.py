@@ -0,0 +1,63 @@
+"""Add the stats table, with manifest counters kept up to date by triggers.
+
+Revision ID: e1f5a8c06d34
+Revises: a4e7c19d3b60
+Create Date: 2026-10-18 15:37:12.602194
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f5a8c06d34'
+down_revision = 'a4e7c19d3b60'
+branch_labels = None
+depends_on = None
+
+# Each counter is: (table, the columns it depends on, a condition on a row, with `{r}` in place of the row name).
+# Any later migration which rebuilds one of these tables must recreate its triggers.
+_stats = {
+    'total_files': ('files', [], '1'),
+    'total_files_dl': ('files', ['downloaded'], '{r}.downloaded = 1'),
+    'total_submissions': ('posts', ['type'], "{r}.type = 'Submission'"),
+    'total_comments': ('posts', ['type'], "{r}.type = 'Comment'"),
+    'total_urls': ('urls', ['processed'], '{r}.processed = 1'),
+    'total_urls_failed': ('urls', ['failed'], '{r}.failed = 1'),
+}
+_tables = ['files', 'posts', 'urls']
+
+
+def _delta(table, *rows):
+    """ Build an UPDATE statement, which adds the conditions of the first row and subtracts those of the second. """
+    cases = []
+    for name, (tbl, _, cond) in _stats.items():
+        if tbl == table:
+            diff = ' - '.join('IFNULL(%s, 0)' % cond.format(r=r) for r in rows)
+            cases.append("WHEN '%s' THEN %s" % (name, diff))
+    names = ', '.join("'%s'" % n for n, s in _stats.items() if s[0] == table)
+    return 'UPDATE stats SET value = value + (CASE name %s ELSE 0 END) WHERE name IN (%s);' % (' '.join(cases), names)
+
+
+def upgrade():
+    op.create_table('stats',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    conn = op.get_bind()
+    for name, (table, _, cond) in _stats.items():
+        conn.execute("INSERT INTO stats (name, value) SELECT '%s', COUNT(*) FROM %s WHERE %s" % (name, table, cond.format(r=table)))
+    for table in _tables:
+        columns = sorted(set(c for s in _stats.values() if s[0] == table for c in s[1]))
+        conn.execute('CREATE TRIGGER stats_%s_insert AFTER INSERT ON %s BEGIN %s END' % (table, table, _delta(table, 'new')))
+        conn.execute('CREATE TRIGGER stats_%s_delete AFTER DELETE ON %s BEGIN %s END' % (table, table, _delta(table, 'old').replace('value + (', 'value - (')))
+        conn.execute('CREATE TRIGGER stats_%s_update AFTER UPDATE OF %s ON %s BEGIN %s END' % (table, ', '.join(columns), table, _delta(table, 'new', 'old')))
+
+
+def downgrade():
+    conn = op.get_bind()
+    for table in _tables:
+        for event in ['insert', 'delete', 'update']:
+            conn.execute('DROP TRIGGER IF EXISTS stats_%s_%s' % (table, event))
+    op.drop_table('stats')
@@ -10,6 +10,8 @@ class File(sql.Base):
 	path = Column(String, nullable=False, unique=True)
 	hash = relationship("Hash", uselist=False, back_populates="file")
 	downloaded = Column(Boolean, nullable=False, default=False)
+	sha1 = Column(String, default=None)  # Recorded while downloading, when the Handler can hash the file on the fly.
+	size = Column(Integer, default=None, index=True)
 	urls = relationship("URL", back_populates="file")
 
 	def __repr__(self):
@@ -26,6 +28,8 @@ class Hash(sql.Base):  # TODO: Use this table.
 	p2 = Column(String, index=True)
 	p3 = Column(String, index=True)
 	p4 = Column(String, index=True)
+	dhash = Column(Integer, index=True)  # Visual hashes only, stored as a signed 64-bit integer.
+	partial_hash = Column(String, index=True)  # Non-image Files are only fully hashed once this collides.
 
 	def __repr__(self):
 		return '<Hash ID: %s, Full Hash: "%s">' % (self.id, self.full_hash)
@@ -35,6 +39,19 @@ class Hash(sql.Base):  # TODO: Use this table.
 		""" Split the given Hash string into sections, formatted to fit in the Hash table. """
 		return [hash_string[i:i + 4] for i in range(0, len(hash_string), 4)]
 
+	@staticmethod
+	def is_complete():
+		""" A filter for Hashes which finished deduplication, including unique files which only needed a partial hash. """
+		return (Hash.full_hash != None) | (Hash.partial_hash != None)
+
+	@staticmethod
+	def to_dhash_int(hash_string):
+		""" Convert the given 16-character visual hash into a signed 64-bit integer, or None for any other hash. """
+		if not hash_string or len(hash_string) != 16:
+			return None
+		value = int(hash_string, 16)
+		return value - (1 << 64) if value >= (1 << 63) else value
+
 	@staticmethod
 	def make_hash(file, hash_string):
 		"""
@@ -54,4 +71,5 @@ class Hash(sql.Base):  # TODO: Use this table.
 				p2=sp[1],
 				p3=sp[2],
 				p4=sp[3],
+				dhash=Hash.to_dhash_int(hash_string)
 			)
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Integer
+
+import sql
+
+
+class Stat(sql.Base):
+	"""
+	A named counter summarizing the manifest, such as the total number of downloaded Files.
+	These are kept up to date by triggers in the DB as rows change, so they should never be written directly.
+	"""
+	__tablename__ = 'stats'
+	name = Column(String, primary_key=True)
+	value = Column(Integer, nullable=False, default=0)
+
+	def __repr__(self):
+		return '<Stat %s: %s>' % (self.name, self.value)
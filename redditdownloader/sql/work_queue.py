@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Integer, Boolean, Float, ForeignKey
+
+import sql
+
+
+class WorkItem(sql.Base):
+	"""
+	A URL waiting to be downloaded. Rows are created when a URL is queued, and deleted once it has been ACKed.
+	Downloaders claim released rows by taking a lease on them, which they keep alive with a heartbeat.
+	"""
+	__tablename__ = 'work_queue'
+	url_id = Column(Integer, ForeignKey('urls.id'), primary_key=True)
+	host = Column(String)
+	queued_at = Column(Float, nullable=False, index=True)
+	released = Column(Boolean, nullable=False, default=False, index=True)
+	lease_owner = Column(String, default=None, index=True)
+	lease_expires = Column(Float, default=None)
+	heartbeat = Column(Float, default=None)
+	attempts = Column(Integer, nullable=False, default=0)
+
+	def __repr__(self):
+		return '<WorkItem URL: %s, Host: "%s", Owner: "%s">' % (self.url_id, self.host, self.lease_owner)
@@ -2,6 +2,7 @@
 	Global auth class, for wrapping Praw functionality.
 	Access to Praw should be done exclusively through these methods.
 """
+import threading
 import praw
 import prawcore
 from static import stringutil
@@ -14,13 +15,16 @@ _credentials = None
 _user = None
 _reddit = None
 _logged_in = False
+_login_lock = threading.Lock()  # Sources may be scanned from several threads at once.
 
 
 def check_login(f):
 	def wrapper(*xs, **kws):
 		if not _logged_in:
-			init()
-			login()
+			with _login_lock:
+				if not _logged_in:
+					init()
+					login()
 		return f(*xs, **kws)
 	return wrapper
 
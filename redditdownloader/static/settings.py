@@ -217,12 +217,28 @@ add("auth", Setting("oauth_key", str(uuid.uuid4()), desc="Internal key.", public
 
 add("output", Setting("base_dir", os.path.join(os.getcwd(), 'download'), desc="The base directory to save to. Cannot contain tags."))
 add("output", Setting("manifest", "./manifest.sqlite", desc="Path to the output manifest file, relative to the base download directory. Cannot contain tags."))
+add("output", Setting("hash_cache", "./hash-cache.sqlite", desc="Path to the file which caches hashes of downloaded files, relative to the base download directory. Leave blank to disable."))
 add("output", Setting("file_name_pattern", '[subreddit]/[title] - ([author])', desc="The ouput file name/path. Supports tags."))
 
 add("processing", Setting("deduplicate_files", True, desc="Remove downloaded files if another copy already exists. Also compares images for visual similarity.", etype="bool"))
+add("processing", Setting("dedup_hamming_distance", 0, desc="How many bits two image hashes may differ by, and still count as duplicates. Zero only matches identical hashes.", etype="int"))
+add("processing", Setting("hash_workers", 0, desc="How many processes hash downloaded files for deduplication. Zero uses one per CPU core.", etype="int"))
 add("processing", Setting("retry_failed", True, desc="Retry downloads that have failed in previous runs.", etype="bool"))
+add("processing", Setting("concurrent_sources", 1, desc="How many Sources may be scanned for new Posts at once.", etype="int"))
+add("processing", Setting("ingest_batch_size", 100, desc="How many scanned Posts are saved to the manifest together.", etype="int"))
+add("processing", Setting("ingest_batch_ms", 2000, desc="The longest time scanned Posts may wait before being saved, in milliseconds.", etype="int"))
 
 add("threading", Setting("concurrent_downloads", 5, desc="How many threads can download media at once.", etype="int"))
+add("threading", Setting("download_engine", 'process', desc="How concurrent downloads are run.", etype="str", opts=[('process', 'One Process per concurrent download'), ('async', 'A few Processes, each running many downloads in an asyncio loop')]))
+add("threading", Setting("async_processes", 2, desc="When using the async download engine, how many Processes to spread the concurrent downloads across. Each Process runs at most http_pool_size downloads, so more are started if needed.", etype="int"))
+add("threading", Setting("http_pool_size", 10, desc="How many keep-alive connections each download Process may hold open to a single host.", etype="int"))
+add("threading", Setting("host_max_in_flight", 3, desc="How many URLs from a single website may be downloading at once. Zero removes the limit.", etype="int"))
+add("threading", Setting("host_requests_per_second", 0, desc="How many new downloads per second may be started on a single website. Zero removes the limit.", etype="int"))
+add("threading", Setting("host_limits", "imgur.com=2/1", desc="Per-website overrides of the above limits, formatted as \"site=in_flight/per_second\", separated by commas.", etype="str"))
+add("threading", Setting("segmented_download_mb", 50, desc="Files at least this large (in MB) are downloaded over several connections at once. Zero disables this.", etype="int"))
+add("threading", Setting("download_segments", 4, desc="How many connections to use for each segmented download.", etype="int"))
+add("threading", Setting("ack_batch_size", 50, desc="How many finished downloads each downloader reports back to the loader at once.", etype="int"))
+add("threading", Setting("ack_batch_ms", 1000, desc="The longest a downloader will hold finished downloads before reporting them, in milliseconds.", etype="int"))
 add("threading", Setting("console_clear_screen", True, desc="If it's okay to clear the terminal while running.", etype="bool"))
 add("threading", Setting("display_refresh_rate", 5, desc="How often the UI should update progress, in seconds.", etype="int"))
 
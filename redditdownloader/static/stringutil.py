@@ -1,4 +1,3 @@
-from bs4 import BeautifulSoup
 from colorama import Fore, Style, init
 import sys
 
@@ -16,6 +15,7 @@ _special_colors = {
 
 def html_elements(html_string, tag='a', tag_val='href'):
 	""" Get all the href elements from this HTML string. """
+	from bs4 import BeautifulSoup
 	soup = BeautifulSoup(html_string, 'html.parser')
 	urls = []
 	for link in soup.findAll(tag):
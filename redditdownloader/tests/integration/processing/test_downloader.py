@@ -25,11 +25,20 @@ class DownloaderTest(EnvironmentTest):
 
 	def test_download(self):
 		""" Downloader should work """
+		self._run_downloader(lambda reader, ack_queue: downloader.Downloader(
+			reader, ack_queue, settings.to_json(), multiprocessing.RLock()))
+
+	def test_async_download(self):
+		""" AsyncDownloader should work """
+		self._run_downloader(lambda reader, ack_queue: downloader.AsyncDownloader(
+			reader, ack_queue, settings.to_json(), multiprocessing.RLock(), max_tasks=4))
+
+	def _run_downloader(self, build):
 		stop_event = multiprocessing.Event()
 		in_queue = multiprocessing.Queue()
 		ack_queue = multiprocessing.Queue()
 		reader = QueueReader(in_queue, stop_event)
-		dl = downloader.Downloader(reader, ack_queue, settings.to_json(), multiprocessing.RLock())
+		dl = build(reader, ack_queue)
 		stats = {'ack': 0, 'sent': 0}
 
 		def add_test(inf):
@@ -43,9 +52,9 @@ class DownloaderTest(EnvironmentTest):
 				sent.append(l.id)
 			while time.time() - st < 30 and sent:
 				try:
-					rd = ack_queue.get(block=True, timeout=.5)
-					inf['ack'] += 1
-					sent.remove(rd.url_id)
+					for rd in ack_queue.get(block=True, timeout=.5):
+						inf['ack'] += 1
+						sent.remove(rd.url_id)
 				except queue.Empty:
 					pass
 			sess.close()
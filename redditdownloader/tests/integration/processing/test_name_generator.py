@@ -54,3 +54,20 @@ class NameGeneratorTest(EnvironmentTest):
 		tp = self.sess.query(sql.Post).filter(sql.Post.title == 'test').first()
 		with self.assertRaises(Exception, msg='Failed to catch broken pattern!'):
 			ng.choose_file_name(tp.urls[0], tp, sql.session(), album_size=1)
+
+	def test_reserved_file_names(self):
+		""" Chosen file names should be reserved, even before their Files are saved """
+		tp = self.sess.query(sql.Post).filter(sql.Post.title == 'test').first()
+		names = [ng.choose_file_name(tp.urls[0], tp, self.sess, album_size=1) for _ in range(5)]
+		self.assertEqual(['%s - %s' % (names[0], i) for i in range(2, 6)], names[1:], msg='Failed to skip reserved names!')
+
+	def test_path_index(self):
+		""" The path index should match prefixes like the original LIKE query, with album exclusions """
+		index = ng._get_index(self.sess)
+		for f in self.sess.query(sql.File):
+			self.assertTrue(index.is_taken(f.path[:-1].upper()), msg='Failed to find existing path prefix: %s' % f.path)
+		self.assertFalse(index.is_taken('aww/no such file'))
+		index.add('aww/zzz album/01', album_id=7)
+		self.assertFalse(index.is_taken('aww/zzz album', album_id=7), msg='Files in the same album should not collide!')
+		self.assertTrue(index.is_taken('aww/zzz album', album_id=8))
+		self.assertTrue(index.is_taken('aww/zzz album'))
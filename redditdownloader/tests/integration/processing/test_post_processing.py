@@ -0,0 +1,113 @@
+import static.settings as settings
+import sql
+from tests.mock import EnvironmentTest, Object
+from processing.post_processing import Deduplicator, HashWorker, FileHasher
+from processing.wrappers import SanitizedRelFile
+import importlib
+import multiprocessing
+from PIL import Image
+import time
+
+
+class DeduplicatorTest(EnvironmentTest):
+	env = 'rmd_staged_db'
+
+	def setUp(self):
+		importlib.reload(settings)
+		importlib.reload(sql)
+		settings.load(self.settings_file)
+		settings.put('output.base_dir', self.dir, save_after=False)
+		sql.init_from_settings()
+		self.sess = sql.session()
+
+	def tearDown(self):
+		sql.close()
+
+	def _dedup(self, file_queue=None, **kwargs):
+		dedup = Deduplicator(settings.to_json(), multiprocessing.Event(), multiprocessing.RLock(), file_queue, **kwargs)
+		dedup._session = self.sess
+		return dedup
+
+	def test_find_unhashed(self):
+		""" The startup catch-up should find every downloaded File without a hash """
+		hashed = set(int(h.file_id) for h in self.sess.query(sql.Hash).filter(sql.Hash.full_hash != None, sql.Hash.file_id != None))
+		expected = set(f.id for f in self.sess.query(sql.File).filter(sql.File.downloaded == True) if f.id not in hashed)
+		self.assertEqual(expected, self._dedup()._find_unhashed(), msg='Found the wrong unhashed Files!')
+
+	def test_collect_files(self):
+		""" File IDs sent by the Downloaders should all be collected into the pending set """
+		file_queue = multiprocessing.Queue()
+		for i in range(5):
+			file_queue.put(i)
+		time.sleep(.1)  # Let the Queue's feeder thread catch up.
+		dedup = self._dedup(file_queue)
+		dedup._collect_files(timeout=1)
+		self.assertEqual(set(range(5)), dedup._pending, msg='Failed to collect every File ID!')
+
+	def test_skip_hashed(self):
+		""" Pending Files which already have a hash should be skipped, and cleared """
+		dedup = self._dedup()
+		dedup.dedup_ignore_ids = set()
+		dedup._pending = set(int(h.file_id) for h in self.sess.query(sql.Hash).filter(sql.Hash.full_hash != None))
+		self.assertTrue(dedup._pending, msg='The test environment has no hashed Files!')
+		self.assertEqual(0, dedup._dedupe(), msg='Rechecked Files which were already hashed!')
+		self.assertFalse(dedup._pending, msg='Pending Files were not cleared!')
+
+	def test_hash_workers(self):
+		""" Images hashed by the HashWorker pool should match hashing them directly """
+		jobs, results, stop = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Event()
+		workers = [HashWorker(jobs, results, stop) for _ in range(2)]
+		for w in workers:
+			w.start()
+		try:
+			files = []
+			for i in range(4):
+				path = SanitizedRelFile(self.dir, 'hash-test-%s.%s' % (i, 'png' if i % 2 else 'txt'))
+				if i % 2:
+					Image.new('RGB', (64, 64), (40 * i, 10, 200)).save(path.absolute())
+				else:
+					with open(path.absolute(), 'w') as o:
+						o.write('hash worker test %s' % i)
+				files.append((Object(id=i), path))
+			dedup = self._dedup(job_queue=jobs, result_queue=results, hash_stop=stop)
+			hashed = {f.id: h for f, h in dedup._hash_files(files)}
+			self.assertEqual({f.id: FileHasher.get_visual_hash(p.absolute()) for f, p in files}, hashed)
+			self.assertIsNone(hashed[0], msg='Visually hashed a file which is not an image!')
+		finally:
+			stop.set()
+			for w in workers:
+				w.join(5)
+
+	def test_dhash_index(self):
+		""" Stored visual hashes should be backfilled as integers, and found in the BK-tree """
+		hashes = [h for h in self.sess.query(sql.Hash).filter(sql.Hash.id >= 0) if h.full_hash and len(h.full_hash) == 16]
+		self.assertTrue(hashes, msg='The test environment has no visual hashes!')
+		dedup = self._dedup()
+		dedup._build_dhash_index()
+		for h in hashes:
+			self.assertEqual(sql.Hash.to_dhash_int(h.full_hash), h.dhash, msg='The dhash column was not backfilled!')
+			self.assertIn(int(h.file_id), dedup._dhash_index.search(h.dhash, 0))
+
+	def test_staged_content_hash(self):
+		""" Non-image Files should only be fully hashed when their size and partial hash collide """
+		dedup = self._dedup()
+		dedup._special_sha = False
+		made = []
+		for i, content in enumerate([b'a' * 1000, b'a' * 1000, b'b' * 1000, b'c' * 999]):
+			path = SanitizedRelFile(self.dir, 'staged-%s.bin' % i)
+			with open(path.absolute(), 'wb') as o:
+				o.write(content)
+			f = sql.File(path=path.relative(), downloaded=True)
+			self.sess.add(f)
+			self.sess.commit()
+			full, partial = dedup._content_hash(f, path)
+			made.append((f, full, partial))
+			f.hash = sql.Hash.make_hash(f, full) if full else sql.Hash(file_id=f.id, partial_hash=partial)
+			f.hash.partial_hash = partial
+			self.sess.commit()
+		self.assertIsNone(made[0][1], msg='Fully hashed a File with a unique size!')
+		self.assertEqual(FileHasher._sha_hash(SanitizedRelFile(self.dir, 'staged-1.bin').absolute()), made[1][1], msg='Colliding File was not fully hashed!')
+		self.assertIsNotNone(made[0][0].hash.full_hash, msg='The earlier colliding File was not fully hashed!')
+		self.assertIsNone(made[2][1], msg='Fully hashed a File whose partial hash was unique!')
+		self.assertIsNone(made[3][1], msg='Fully hashed a File with a unique size!')
+		self.assertEqual([1000, 1000, 1000, 999], [m[0].size for m in made], msg='File sizes were not recorded!')
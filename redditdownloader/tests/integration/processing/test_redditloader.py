@@ -0,0 +1,155 @@
+import static.settings as settings
+import sql
+from tests.mock import EnvironmentTest
+from processing.redditloader import RedditLoader
+from processing.wrappers import AckPacket
+from sources.source import Source
+import importlib
+import multiprocessing
+import time
+
+
+class FakeElement:
+	""" A minimal stand-in for a RedditElement, which avoids needing praw objects. """
+	def __init__(self, reddit_id, urls):
+		self.id = reddit_id
+		self.type = 'Submission'
+		self.title = 'loader test %s' % reddit_id
+		self.author = 'loaderuser'
+		self.body = ''
+		self.parent = None
+		self.subreddit = 'aww'
+		self.over_18 = False
+		self.created_utc = 1552739416
+		self.num_comments = 0
+		self.score = 1
+		self.source_alias = None
+		self._urls = urls
+
+	def get_urls(self):
+		return self._urls[:]
+
+	def set_source(self, source_obj):
+		self.source_alias = str(source_obj.get_alias())
+
+
+class FakeSource(Source):
+	def __init__(self, elements, alias='fake-alias'):
+		super().__init__(source_type='fake-source', description='Test source.')
+		self.elements = elements
+		self.set_alias(alias)
+
+	def get_elements(self):
+		for e in self.elements:
+			yield e
+
+
+class StallingSource(FakeSource):
+	""" A Source which stalls after its first element, until that element has been saved. """
+	def get_elements(self):
+		yield self.elements[0]
+		sess = sql.session()
+		start = time.time()
+		self.saved_while_stalled = False
+		while time.time() - start < 5 and not self.saved_while_stalled:
+			time.sleep(0.05)
+			self.saved_while_stalled = sess.query(sql.Post).filter(sql.Post.reddit_id == self.elements[0].id).count() > 0
+		sess.close()
+		yield from self.elements[1:]
+
+
+class RedditLoaderTest(EnvironmentTest):
+	env = 'rmd_staged_db'
+
+	def setUp(self):
+		importlib.reload(settings)
+		importlib.reload(sql)
+		settings.load(self.settings_file)
+		settings.put('output.base_dir', self.dir, save_after=False)
+		sql.init_from_settings()
+
+	def tearDown(self):
+		sql.close()
+
+	def _scan(self, elements, batch_size, sources=None, workers=1, batch_ms=2000):
+		settings.put('processing.ingest_batch_size', batch_size, save_after=False)
+		settings.put('processing.ingest_batch_ms', batch_ms, save_after=False)
+		sources = sources or [FakeSource(elements)]
+		loader = RedditLoader(sources=sources, settings_json=settings.to_json(), db_lock=multiprocessing.RLock())
+		loader._session = sql.session()
+		loader._batch_size = settings.get('processing.ingest_batch_size')
+		loader._batch_ms = settings.get('processing.ingest_batch_ms')
+		loader._scan_workers = workers
+		loader._scan_sources()
+		return loader
+
+	def test_batched_scan(self):
+		""" Scanned elements should be saved in batches, skipping existing URLs """
+		elements = [FakeElement('t3_batch%s' % i, ['https://i.redd.it/batch-%s.jpg' % i]) for i in range(7)]
+		elements.append(FakeElement('t3_batchdup', ['https://i.redd.it/batch-1.jpg']))  # URL already in this scan.
+		elements.append(FakeElement('t3_batchold', ['https://i.redd.it/0l78k9pfu6d21.jpg']))  # URL already in the DB.
+		loader = self._scan(elements, batch_size=3)
+		sess = sql.session()
+		for e in elements:
+			post = sess.query(sql.Post).filter(sql.Post.reddit_id == e.id).first()
+			self.assertTrue(post, msg='Failed to save Post %s!' % e.id)
+			self.assertEqual('fake-alias', post.source_alias, msg='Source alias was not applied!')
+		for i in range(7):
+			url = sess.query(sql.URL).filter(sql.URL.address == 'https://i.redd.it/batch-%s.jpg' % i).all()
+			self.assertEqual(1, len(url), msg='Incorrect number of URLs created for element %s!' % i)
+			self.assertTrue(url[0].file, msg='URL is missing a File!')
+		self.assertEqual(7, loader.progress.get_found(), msg='Incorrect number of URLs were queued!')
+		queued = sess.query(sql.WorkItem).join(sql.URL, sql.URL.id == sql.WorkItem.url_id).filter(sql.URL.address.like('%/batch-%'))
+		self.assertEqual(7, queued.count(), msg='Queued URLs were not saved to the work queue!')
+
+	def test_recovery_chunks(self):
+		""" Unfinished URLs should be recovered in ordered chunks, skipping URLs already queued """
+		sess = sql.session()
+		with sess.no_autoflush:
+			for u in sess.query(sql.URL).limit(4):
+				u.processed = False
+		sess.commit()
+		queued = set(w.url_id for w in sess.query(sql.WorkItem))
+		expected = [u.id for u in sess.query(sql.URL).filter(sql.URL.processed == False).order_by(sql.URL.id) if u.id not in queued]
+		sess.add(sql.WorkItem(url_id=expected.pop(0), queued_at=0))
+		sess.commit()
+		loader = RedditLoader(sources=[], settings_json=settings.to_json(), db_lock=multiprocessing.RLock())
+		loader._session = sess
+		chunks = list(loader._find_unfinished(retry_failed=False, chunk_size=2))
+		self.assertTrue(all(len(c) <= 2 for c in chunks), msg='Recovery chunks were too large!')
+		self.assertEqual(expected, [row.id for c in chunks for row in c], msg='Recovered the wrong URLs!')
+
+	def test_apply_acks(self):
+		""" A batch of acks should mark every URL processed, and clear them from the work queue """
+		sess = sql.session()
+		ids = [u.id for u in sess.query(sql.URL).limit(3)]
+		for url_id in ids:
+			sess.query(sql.URL).filter(sql.URL.id == url_id).update({'processed': False})
+			sess.merge(sql.WorkItem(url_id=url_id, queued_at=0))
+		sess.commit()
+		loader = RedditLoader(sources=[], settings_json=settings.to_json(), db_lock=multiprocessing.RLock())
+		loader._session = sess
+		albums = loader._apply_acks([AckPacket(url_id=i, extra_urls=[]) for i in ids])
+		self.assertEqual([], albums, msg='Created Album URLs without any extra URLs!')
+		self.assertEqual(3, sess.query(sql.URL).filter(sql.URL.id.in_(ids), sql.URL.processed == True).count())
+		self.assertEqual(0, sess.query(sql.WorkItem).filter(sql.WorkItem.url_id.in_(ids)).count())
+
+	def test_concurrent_scan(self):
+		""" Sources scanned concurrently should all be saved, each with their own alias """
+		sources = [FakeSource([FakeElement('t3_multi%s_%s' % (s, i), ['https://i.redd.it/multi-%s-%s.jpg' % (s, i)]) for i in range(5)], alias='multi-%s' % s) for s in range(3)]
+		loader = self._scan(None, batch_size=4, sources=sources, workers=3)
+		sess = sql.session()
+		for idx, src in enumerate(sources):
+			for e in src.elements:
+				post = sess.query(sql.Post).filter(sql.Post.reddit_id == e.id).first()
+				self.assertTrue(post, msg='Failed to save Post %s!' % e.id)
+				self.assertEqual('multi-%s' % idx, post.source_alias, msg='Wrong source alias was applied!')
+		self.assertEqual(15, loader.progress.get_found(), msg='Incorrect number of URLs were queued!')
+
+	def test_batch_timeout(self):
+		""" A partial batch should be saved once it is older than the batch time, even while its Source stalls """
+		elements = [FakeElement('t3_stall%s' % i, ['https://i.redd.it/stall-%s.jpg' % i]) for i in range(2)]
+		source = StallingSource(elements)
+		loader = self._scan(None, batch_size=100, sources=[source], batch_ms=50)
+		self.assertTrue(source.saved_while_stalled, msg='The partial batch was not flushed while the Source stalled!')
+		self.assertEqual(2, loader.progress.get_found(), msg='Incorrect number of URLs were queued!')
@@ -2,6 +2,32 @@ import processing.wrappers.http_downloader as http
 import processing.wrappers.rel_file as rel
 from processing.wrappers import DownloaderProgress
 from tests.mock import StagedTest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Thread
+
+
+class _LocalServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class _GifHandler(BaseHTTPRequestHandler):
+	""" Answers every HEAD request as a GIF, keeping the connection alive, and counts the connections made. """
+	protocol_version = 'HTTP/1.1'
+	connections = 0
+
+	def setup(self):
+		super().setup()
+		_GifHandler.connections += 1
+
+	def do_HEAD(self):
+		self.send_response(200)
+		self.send_header('Content-Type', 'image/gif')
+		self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	def log_message(self, *args):
+		pass
 
 
 class HttpDownloaderTest(StagedTest):
@@ -36,3 +62,20 @@ class HttpDownloaderTest(StagedTest):
 		""" Downloader should ID invalid URLs """
 		ftype = http.is_media_url("https://raw.githubusercontent.com/shadowmoose/RedditDownloader/master/Dockerfile")
 		self.assertFalse(ftype, "Did not correctly identify image file!")
+
+	def test_connection_reuse(self):
+		""" Requests to the same host should reuse pooled connections """
+		server = _LocalServer(('127.0.0.1', 0), _GifHandler)
+		Thread(target=server.serve_forever, daemon=True).start()
+		try:
+			url = 'http://127.0.0.1:%s/test.gif' % server.server_address[1]
+			before = http.connection_stats()
+			for i in range(3):
+				self.assertTrue(http.is_media_url(url), "Did not correctly identify image file!")
+			after = http.connection_stats()
+		finally:
+			server.shutdown()
+			server.server_close()
+		self.assertGreaterEqual(after['requests'] - before['requests'], 3, "Requests were not counted!")
+		self.assertEqual(1, after['connections'] - before['connections'], "Requests did not share one connection!")
+		self.assertEqual(1, _GifHandler.connections, "The server saw more than one connection!")
@@ -0,0 +1,49 @@
+import static.settings as settings
+import sql
+from tests.mock import EnvironmentTest
+from processing.wrappers import SqlQueueReader
+import importlib
+import multiprocessing
+import queue
+
+
+class SqlQueueReaderTest(EnvironmentTest):
+	env = 'rmd_staged_db'
+
+	def setUp(self):
+		importlib.reload(settings)
+		importlib.reload(sql)
+		settings.load(self.settings_file)
+		settings.put('output.base_dir', self.dir, save_after=False)
+		sql.init_from_settings()
+		self.sess = sql.session()
+		self.ids = [u.id for u in self.sess.query(sql.URL).order_by(sql.URL.id).limit(3)]
+		for idx, url_id in enumerate(self.ids):
+			self.sess.add(sql.WorkItem(url_id=url_id, host='test', queued_at=idx, released=idx < 2))
+		self.sess.commit()
+
+	def tearDown(self):
+		self.sess.query(sql.WorkItem).delete()
+		self.sess.commit()
+		sql.close()
+
+	def _reader(self, **kwargs):
+		return SqlQueueReader(stop_event=multiprocessing.Event(), db_lock=multiprocessing.RLock(), **kwargs)
+
+	def test_claim(self):
+		""" Readers should lease released URLs in order, and never share a lease """
+		first, second = self._reader(), self._reader()
+		self.assertEqual(self.ids[0], first.next(hang=False), msg='Did not claim the oldest URL!')
+		self.assertEqual(self.ids[1], second.next(hang=False), msg='Claimed an already-leased URL!')
+		with self.assertRaises(queue.Empty, msg='Claimed an unreleased URL!'):
+			first.next(hang=False)
+		item = self.sess.query(sql.WorkItem).filter(sql.WorkItem.url_id == self.ids[0]).first()
+		self.assertEqual(first.owner(), item.lease_owner, msg='Lease owner was not stored!')
+		self.assertEqual(1, item.attempts, msg='Lease attempt was not counted!')
+
+	def test_expired_lease(self):
+		""" URLs with an expired lease should be claimed again """
+		dead, alive = self._reader(lease_seconds=-1), self._reader()
+		dead.next(hang=False)
+		dead.next(hang=False)
+		self.assertEqual(self.ids[0], alive.next(hang=False), msg='Failed to reclaim an expired lease!')
@@ -69,3 +69,42 @@ class SqlitePostSearcherTest(EnvironmentTest):
 		self.assertGreater(len(ser['urls']), 0, msg='Lost Post URLs in encode!')
 		for u in ser['urls']:
 			self.assertIn('file', u, msg='Lost file in URL encode! %s' % u)
+
+	def test_full_text_search(self):
+		""" Searches should use the full-text index, and match the same Posts as the slower LIKE search """
+		self.assertTrue(self.ps.has_index(), msg='The full-text index was not built!')
+		self.assertIsNotNone(self.ps.match_expression(['title', 'author'], 'test user'))
+		self.assertIsNone(self.ps.match_expression(['title'], '%'), msg='A term without words should not use the index!')
+		fields = self.ps.get_searchable_fields()
+		posts = sql.session().query(sql.Post).join(sql.URL).join(sql.File)\
+			.filter(sql.URL.processed != False, sql.URL.failed != True).all()
+		self.assertGreater(len(posts), 0, msg="Didn't find enough Posts to test!")
+		for p in posts:
+			word = p.title.split()[0]
+			found = self.ps.search_fields(fields, word)
+			self.assertIn(p, found, msg='Failed to find Post by the title word "%s"' % word)
+
+	def test_full_text_sync(self):
+		""" The full-text index should follow changes to the posts table """
+		sess = sql.session()
+		post = sess.query(sql.Post).join(sql.URL).join(sql.File)\
+			.filter(sql.URL.processed != False, sql.URL.failed != True).first()
+		old_word = post.title.split()[0]
+		post.title = 'Zyxwvut indexed title'
+		sess.commit()
+		self.assertEqual([post], self.ps.search_fields(['title'], 'zyxw'), msg='Updated Post was not found!')
+		self.assertEqual([], [p for p in self.ps.search_fields(['title'], old_word) if p == post], msg='Old title was still indexed!')
+
+	def test_search_page(self):
+		""" Searches should be paginated, without duplicate Posts """
+		fields = self.ps.get_searchable_fields()
+		everything = self.ps.search_fields(fields, '')
+		self.assertEqual(len(set(everything)), len(everything), msg='Search returned duplicate Posts!')
+		self.assertGreater(len(everything), 2, msg="Didn't find enough Posts to test!")
+		pages = []
+		for page in range(len(everything)):
+			total, posts = self.ps.search_page(fields, '', 2, page)
+			self.assertEqual(len(everything), total, msg='Wrong total count!')
+			pages.extend(posts)
+		self.assertEqual(everything, pages, msg='Pages did not cover every Post in order!')
+		self.assertIn('urls', pages[0].__dict__, msg='URLs were not loaded up front!')
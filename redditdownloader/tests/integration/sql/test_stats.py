@@ -0,0 +1,42 @@
+import importlib
+import static.settings as settings
+import sql
+from tests.mock import EnvironmentTest
+
+
+class SqliteStatsTest(EnvironmentTest):
+	env = 'rmd_staged_db'
+
+	def setUp(self):
+		importlib.reload(sql)
+		settings.load(self.settings_file)
+		sql.init_from_settings()
+		self.sess = sql.session()
+
+	def tearDown(self):
+		sql.close()
+
+	def _counted(self):
+		return {
+			'total_files': self.sess.query(sql.File).count(),
+			'total_files_dl': self.sess.query(sql.File).filter(sql.File.downloaded).count(),
+			'total_submissions': self.sess.query(sql.Post).filter(sql.Post.type == 'Submission').count(),
+			'total_comments': self.sess.query(sql.Post).filter(sql.Post.type == 'Comment').count(),
+			'total_urls': self.sess.query(sql.URL).filter(sql.URL.processed).count(),
+			'total_urls_failed': self.sess.query(sql.URL).filter(sql.URL.failed).count()
+		}
+
+	def test_stats(self):
+		""" The stats table should match full counts, as rows are added, changed, and removed """
+		self.assertEqual(self._counted(), sql.get_stats(self.sess), msg='Stats were not initialized correctly!')
+		post = self.sess.query(sql.Post).filter(sql.Post.type == 'Submission').first()
+		post.type = 'Comment'
+		url = self.sess.query(sql.URL).filter(sql.URL.failed != True).first()
+		url.failed = True
+		url.processed = False
+		self.sess.add(sql.File(path='stats-test.txt', downloaded=True))
+		self.sess.commit()
+		self.assertEqual(self._counted(), sql.get_stats(self.sess), msg='Stats did not follow updated rows!')
+		self.sess.query(sql.File).filter(sql.File.path == 'stats-test.txt').delete()
+		self.sess.commit()
+		self.assertEqual(self._counted(), sql.get_stats(self.sess), msg='Stats did not follow deleted rows!')
@@ -0,0 +1,30 @@
+from tools.rehash_library import rehash_library
+from processing.post_processing import FileHasher
+from processing.hash_cache import HashCache
+from tests.mock import StagedTest
+from PIL import Image
+import os
+
+
+class RehashLibraryTest(StagedTest):
+	def test_rehash(self):
+		""" Rehashing should fill the cache, which FileHasher then uses instead of reading files """
+		lib = os.path.join(self.dir, 'rehash-library')
+		os.makedirs(os.path.join(lib, 'sub'))
+		Image.new('RGB', (32, 32), (255, 0, 0)).save(os.path.join(lib, 'sub', 'red.png'))
+		with open(os.path.join(lib, 'notes.txt'), 'w') as f:
+			f.write('not an image')
+		cache_file = os.path.join(self.dir, 'rehash-cache.sqlite')
+		hashed, failed, pruned = rehash_library(lib, cache_file, workers=2, verbose=False)
+		self.assertEqual((2, 0, 0), (hashed, failed, pruned))
+		cache = HashCache(cache_file)
+		self.assertEqual(3, len(cache), msg='Expected a visual hash for both files, and a SHA1 for the text file!')
+		FileHasher.use_cache(cache_file)
+		try:
+			self.assertEqual(
+				FileHasher._read_sha_hash(os.path.join(lib, 'notes.txt')),
+				cache.lookup(os.path.join(lib, 'notes.txt'), 'sha1', lambda fn: self.fail('File was read again!')))
+			self.assertIsNotNone(FileHasher.get_visual_hash(os.path.join(lib, 'sub', 'red.png')))
+		finally:
+			FileHasher.use_cache(None)
+			cache.close()
@@ -0,0 +1,26 @@
+import unittest
+import random
+from processing.bk_tree import BKTree, hamming_distance
+
+
+class BKTreeTest(unittest.TestCase):
+	def test_hamming_distance(self):
+		""" Hamming distance should count differing bits, including the sign bit """
+		self.assertEqual(0, hamming_distance(5, 5))
+		self.assertEqual(2, hamming_distance(0b1010, 0b0110))
+		self.assertEqual(1, hamming_distance(0, -(1 << 63)))
+		self.assertEqual(64, hamming_distance(0, -1))
+
+	def test_search(self):
+		""" Searching should find exactly the items within the distance, like a full scan would """
+		rand = random.Random(1234)
+		values = [rand.getrandbits(64) - (1 << 63) for _ in range(500)]
+		values += [v ^ (1 << rand.randrange(64)) for v in values[:50]]  # Add some near-duplicates.
+		tree = BKTree()
+		for idx, v in enumerate(values):
+			tree.add(v, idx)
+		self.assertEqual(len(values), len(tree))
+		for search in values[:60]:
+			for dist in (0, 1, 4):
+				expected = sorted(i for i, v in enumerate(values) if hamming_distance(search, v) <= dist)
+				self.assertEqual(expected, sorted(tree.search(search, dist)), msg='Wrong matches at distance %s!' % dist)
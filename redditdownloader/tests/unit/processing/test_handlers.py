@@ -0,0 +1,21 @@
+import unittest
+import subprocess
+import sys
+import os
+
+_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../'))
+
+
+def _loaded_modules(code):
+	""" Run the given code in a fresh interpreter, and return the names of every module it imported. """
+	script = 'import sys\n%s\nprint("\\n".join(sys.modules))' % code
+	out = subprocess.check_output([sys.executable, '-c', script], cwd=_root, env=dict(os.environ, PYTHONPATH=_root))
+	return set(out.decode().split())
+
+
+class LazyImportTest(unittest.TestCase):
+	def test_handler_imports(self):
+		""" Listing the Handlers should not load any of the heavy libraries they use """
+		mods = _loaded_modules('import processing.handlers as h\nh.sorted_list()')
+		for heavy in ['youtube_dl', 'newspaper', 'lxml', 'imgurpython']:
+			self.assertNotIn(heavy, mods, msg='Handler list imported "%s"!' % heavy)
@@ -0,0 +1,49 @@
+import unittest
+import os
+import tempfile
+from processing.hash_cache import HashCache
+
+
+class HashCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.cache = HashCache(os.path.join(self.dir.name, 'cache.sqlite'))
+		self.file = os.path.join(self.dir.name, 'file.txt')
+		with open(self.file, 'w') as f:
+			f.write('test')
+		self.calls = []
+
+	def tearDown(self):
+		self.cache.close()
+		self.dir.cleanup()
+
+	def _compute(self, filename):
+		self.calls.append(filename)
+		return 'hash-%s' % len(self.calls)
+
+	def test_lookup(self):
+		""" Cached hashes should be reused until the file changes """
+		self.assertEqual('hash-1', self.cache.lookup(self.file, 'sha1', self._compute))
+		self.assertEqual('hash-1', self.cache.lookup(self.file, 'sha1', self._compute), msg='Cached hash was not used!')
+		self.assertEqual('hash-2', self.cache.lookup(self.file, 'dhash8', self._compute), msg='Hash kinds were not kept apart!')
+		st = os.stat(self.file)
+		os.utime(self.file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+		self.assertEqual('hash-3', self.cache.lookup(self.file, 'sha1', self._compute), msg='Modified file used a stale hash!')
+		self.assertEqual(3, len(self.calls))
+
+	def test_persist_none(self):
+		""" Files which can't be hashed a certain way should not be retried, even after reopening the cache """
+		self.cache.lookup(self.file, 'dhash8', lambda fn: None)
+		self.cache.close()
+		reopened = HashCache(self.cache.db_file)
+		self.assertIsNone(reopened.lookup(self.file, 'dhash8', self._compute))
+		self.assertEqual([], self.calls, msg='Cached result was recomputed!')
+		reopened.close()
+
+	def test_prune(self):
+		""" Entries for deleted files should be pruned """
+		self.cache.lookup(self.file, 'sha1', self._compute)
+		self.cache.lookup(self.file, 'dhash8', self._compute)
+		os.remove(self.file)
+		self.assertEqual(1, self.cache.prune(under_dir=self.dir.name))
+		self.assertEqual(0, len(self.cache))
@@ -0,0 +1,28 @@
+import unittest
+from processing.host_scheduler import HostScheduler, parse_overrides
+
+
+class HostSchedulerTest(unittest.TestCase):
+	def test_parse_overrides(self):
+		""" Host limit overrides should parse, skipping bad entries """
+		self.assertEqual({'imgur.com': (2, 1.0), 'i.redd.it': (5, None)}, parse_overrides('imgur.com=2/1, I.Redd.it=5, bad, x.com=a/b'))
+
+	def test_in_flight_limit(self):
+		""" Each host should only release URLs while it's under its in-flight limit """
+		sched = HostScheduler(max_in_flight=2, overrides={'imgur.com': (1, None)})
+		for i in range(4):
+			sched.add('redd-%s' % i, 'https://i.redd.it/%s.jpg' % i)
+			sched.add('imgur-%s' % i, 'https://i.imgur.com/%s.jpg' % i)
+		self.assertEqual(['redd-0', 'imgur-0', 'redd-1'], list(sched.pop_ready()), msg='Hosts were not interleaved within limits!')
+		self.assertEqual([], list(sched.pop_ready()))
+		sched.release('imgur-0')
+		self.assertEqual(['imgur-1'], list(sched.pop_ready()), msg='Releasing a URL did not free its host!')
+		self.assertEqual(4, sched.pending())
+
+	def test_rate_limit(self):
+		""" A host with a requests-per-second budget should not release a burst """
+		sched = HostScheduler(max_in_flight=0, rps=1)
+		for i in range(3):
+			sched.add(i, 'https://www.example.com/%s' % i)
+		self.assertEqual([0], list(sched.pop_ready()))
+		self.assertEqual('example.com', sched.host_key('https://www.example.com/'))
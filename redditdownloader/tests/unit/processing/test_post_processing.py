@@ -0,0 +1,63 @@
+import unittest
+import io
+import os
+import tempfile
+import random
+from PIL import Image, ImageDraw
+from processing.post_processing import FileHasher
+
+
+def _reference_dhash(image, hash_size=8):
+	""" The original pixel-by-pixel dHash, which the fast version must match exactly. """
+	image = image.convert('L').resize((hash_size + 1, hash_size), Image.ANTIALIAS)
+	value, hex_string = 0, []
+	for index in range(hash_size * hash_size):
+		row, col = divmod(index, hash_size)
+		if image.getpixel((col, row)) > image.getpixel((col + 1, row)):
+			value += 2**(index % 8)
+		if (index % 8) == 7:
+			hex_string.append(hex(value)[2:].rjust(2, '0'))
+			value = 0
+	return ''.join(hex_string)
+
+
+class DHashTest(unittest.TestCase):
+	def _image(self, seed, fmt):
+		rand = random.Random(seed)
+		im = Image.new('RGB', (640, 480))
+		draw = ImageDraw.Draw(im)
+		for _ in range(30):
+			x, y = rand.randrange(640), rand.randrange(480)
+			draw.rectangle([x, y, x + rand.randrange(300), y + rand.randrange(200)], fill=tuple(rand.randrange(256) for _ in range(3)))
+		buff = io.BytesIO()
+		im.save(buff, format=fmt)
+		buff.seek(0)
+		return buff
+
+	def test_matches_reference(self):
+		""" The fast dHash should exactly match the original algorithm """
+		for seed in range(10):
+			expected = _reference_dhash(Image.open(self._image(seed, 'PNG')))
+			value, hex_string = FileHasher.dhash_value(Image.open(self._image(seed, 'PNG')))
+			self.assertEqual(expected, hex_string, msg='Hash differs from the original algorithm!')
+			self.assertEqual(int(hex_string, 16), value, msg='The int and hex hashes disagree!')
+
+	def test_jpeg_draft(self):
+		""" JPEGs should still hash, when decoded at a reduced scale """
+		value, hex_string = FileHasher.dhash_value(Image.open(self._image(1, 'JPEG')))
+		self.assertEqual(16, len(hex_string))
+		self.assertEqual(hex_string, FileHasher._dhash(Image.open(self._image(1, 'JPEG'))))
+
+
+class BestHashTest(unittest.TestCase):
+	def test_known_sha1(self):
+		""" A SHA1 recorded while downloading should be used for non-images, but never for still images """
+		with tempfile.TemporaryDirectory() as tmp:
+			text = os.path.join(tmp, 'test.txt')
+			with open(text, 'w') as o:
+				o.write('not an image')
+			self.assertEqual('known', FileHasher.get_best_hash(text, known_sha1='known'))
+			self.assertEqual(FileHasher._sha_hash(text), FileHasher.get_best_hash(text))
+			image = os.path.join(tmp, 'test.png')
+			Image.new('RGB', (32, 32), (200, 10, 10)).save(image)
+			self.assertEqual(16, len(FileHasher.get_best_hash(image, known_sha1='known')), msg='Used the SHA1 for an image!')
@@ -0,0 +1,52 @@
+import unittest
+import tempfile
+import shutil
+import os
+from unittest.mock import Mock
+import processing.wrappers.http_downloader as http
+from processing.wrappers.http_downloader import PartialDownload
+from processing.wrappers import SanitizedRelFile
+
+
+class MediaSniffTest(unittest.TestCase):
+	def test_sniff_media(self):
+		""" Media types should be recognized from their first bytes """
+		self.assertEqual('png', http._sniff_media_ext(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'))
+		self.assertEqual('jpg', http._sniff_media_ext(b'\xff\xd8\xff\xe0\x00\x10JFIF'))
+		self.assertEqual('gif', http._sniff_media_ext(b'GIF89a\x01\x00'))
+		self.assertEqual('webp', http._sniff_media_ext(b'RIFF\x24\x00\x00\x00WEBPVP8 '))
+		self.assertEqual('mp4', http._sniff_media_ext(b'\x00\x00\x00\x20ftypisom'))
+
+	def test_sniff_non_media(self):
+		""" Non-media bytes should not be recognized """
+		self.assertIsNone(http._sniff_media_ext(b'<!DOCTYPE html><html>'))
+		self.assertIsNone(http._sniff_media_ext(b'RIFF\x24\x00\x00\x00WAVEfmt '))
+		self.assertIsNone(http._sniff_media_ext(b''))
+
+
+class PartialDownloadTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.file = SanitizedRelFile(self.dir, 'partial')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def _write_part(self, validator):
+		partial = PartialDownload(self.file)
+		req = Mock(headers={'etag': validator} if validator else {})
+		with partial.start('https://example.com/a.mp4', req, 'mp4', resume=False) as o:
+			o.write(b'x' * 100)
+		partial.abort()
+
+	def test_resume_headers(self):
+		""" An interrupted download with a validator should resume from its current size """
+		self._write_part('"abc"')
+		partial = PartialDownload(self.file)
+		self.assertEqual({'Range': 'bytes=100-', 'If-Range': '"abc"'}, partial.resume_headers('https://example.com/a.mp4'))
+		self.assertIsNone(partial.resume_headers('https://example.com/other.mp4'), msg='Resumed a different URL!')
+
+	def test_discard_unresumable(self):
+		""" Without a validator, an interrupted download should be deleted """
+		self._write_part(None)
+		self.assertFalse(os.listdir(self.dir), msg='Unresumable part file was kept!')
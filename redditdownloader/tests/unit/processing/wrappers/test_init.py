@@ -1,5 +1,5 @@
 import unittest
-from processing.wrappers import ProgressManifest, DownloaderProgress, LoaderProgress
+from processing.wrappers import ProgressManifest, DownloaderProgress, LoaderProgress, TaskProgress, ProgressEncoder
 import json
 
 
@@ -14,3 +14,12 @@ class WrapperInitTest(unittest.TestCase):
 		)
 		self.assertIsNotNone(json.dumps(progg.to_obj()))
 
+	def test_task_progress(self):
+		""" TaskProgress should keep the same fields as DownloaderProgress, without shared memory """
+		prog = TaskProgress()
+		self.assertEqual(set(DownloaderProgress().fields.keys()), set(prog.fields.keys()), msg='Fields do not match!')
+		prog.set_file('file-name.jpg')
+		prog.set_percent(50)
+		self.assertEqual('file-name.jpg', prog.get_file(), msg='Failed to store the file name!')
+		self.assertEqual('50', prog.get_percent(), msg='Failed to store the percentage!')
+		self.assertIn('file-name.jpg', json.dumps(prog, cls=ProgressEncoder), msg='Failed to encode the TaskProgress!')
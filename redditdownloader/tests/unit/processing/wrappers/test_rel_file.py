@@ -1,4 +1,6 @@
 import unittest
+import tempfile
+import os
 import processing.wrappers.rel_file as rel
 from os.path import abspath
 
@@ -41,6 +43,28 @@ class RelFileTest(unittest.TestCase):
 		with self.assertRaises(TypeError, msg="Failed to sanitize formatting character from file name!"):
 			print(r.absolute() % 1)
 
+	def test_set_ext(self):
+		""" Cached paths should update when the extension is set """
+		r = rel.SanitizedRelFile(base="/Users", file_path="test/file")
+		self.assertEqual(norm("/Users/test/file"), r.absolute())
+		r.set_ext('.jpg')
+		self.assertEqual(norm("/Users/test/file.jpg"), r.absolute(), msg='Absolute path was not updated!')
+		self.assertEqual('test/file.jpg', r.relative(), msg='Relative path was not updated!')
+
+	def test_stat_files(self):
+		""" Bulk file checks should find existing files and their sizes, whether or not the directory is scanned """
+		with tempfile.TemporaryDirectory() as base:
+			os.makedirs(os.path.join(base, 'dir', 'sub'))
+			for i in range(5):
+				with open(os.path.join(base, 'dir', '%s.txt' % i), 'w') as f:
+					f.write('x' * i)
+			files = [rel.RelFile(base, 'dir/%s.txt' % i) for i in range(7)] + [rel.RelFile(base, 'dir/sub')]
+			expected = {files[i].absolute(): i for i in range(5)}
+			self.assertEqual(expected, rel.stat_files(files, min_batch=1), msg='Scanned directory gave the wrong files!')
+			self.assertEqual(expected, rel.stat_files(files, min_batch=100), msg='Checked files gave the wrong files!')
+			self.assertEqual(files[3].size(), 3)
+			self.assertEqual(files[6].size(), 0)
+
 
 def norm(fn):
 	return abspath(fn).replace('\\', '/')
@@ -0,0 +1,16 @@
+import unittest
+from tests.unit.processing.test_handlers import _loaded_modules
+
+
+class MainImportTest(unittest.TestCase):
+	def test_version_imports(self):
+		""" Printing the version should not load the UI, the manifest, or the Sources """
+		mods = _loaded_modules(
+			'import runpy\n'
+			'sys.argv = ["rmd", "--version"]\n'
+			'try:\n'
+			'	runpy.run_path("__main__.py", run_name="__main__")\n'
+			'except SystemExit:\n'
+			'	pass')
+		for heavy in ['eel', 'sql', 'sources', 'praw', 'alembic', 'tests.runner', 'bs4']:
+			self.assertNotIn(heavy, mods, msg='Printing the version imported "%s"!' % heavy)
@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import time
+from processing.post_processing import FileHasher
+
+"""
+	Bulk-hashes every file in a download directory, filling the HashCache.
+	Once it's warm, deduplication over an existing library only has to hash files that are new or have changed.
+"""
+
+
+def _init_worker(cache_file):
+	FileHasher.use_cache(cache_file)
+
+
+def _hash_file(path):
+	""" Hash a single file the same way the Deduplicator would: visually if it's a still image, otherwise by SHA1. """
+	try:
+		return FileHasher.get_visual_hash(path) or FileHasher._sha_hash(path)
+	except Exception:
+		return None
+
+
+def _walk_files(base_dir, skip):
+	dirs = [base_dir]
+	while dirs:
+		try:
+			entries = list(os.scandir(dirs.pop()))
+		except OSError:
+			continue
+		for e in entries:
+			if e.is_dir(follow_symlinks=False):
+				dirs.append(e.path)
+			elif e.is_file(follow_symlinks=False) and not any(e.path.startswith(s) for s in skip):
+				yield e.path
+
+
+def rehash_library(base_dir, cache_file, workers=None, skip=(), verbose=True):
+	"""
+	Hash every file below the given directory with a pool of worker Processes, storing the results in the HashCache.
+	Files which are already cached with the same size and modification time are not read again.
+	Entries for files that no longer exist below the directory are pruned from the cache afterwards.
+	:param base_dir: The download directory to scan.
+	:param cache_file: The path of the HashCache file.
+	:param workers: How many hashing Processes to use. Defaults to one per CPU core.
+	:param skip: Path prefixes to ignore, such as the manifest and cache files themselves.
+	:return: A tuple of (files hashed, files which could not be hashed, cache entries pruned).
+	"""
+	base_dir = os.path.abspath(base_dir)
+	skip = tuple(os.path.abspath(s) for s in skip) + (os.path.abspath(cache_file),)
+	start = time.time()
+	hashed = failed = 0
+	with multiprocessing.Pool(workers or os.cpu_count() or 1, initializer=_init_worker, initargs=(cache_file,)) as pool:
+		for h in pool.imap_unordered(_hash_file, _walk_files(base_dir, skip), chunksize=16):
+			if h is None:
+				failed += 1
+			else:
+				hashed += 1
+			if verbose and (hashed + failed) % 1000 == 0:
+				print('Hashed %s files (%.1f/sec)...' % (hashed + failed, (hashed + failed) / max(time.time() - start, .001)))
+	_init_worker(cache_file)
+	pruned = FileHasher.cache.prune(under_dir=base_dir)
+	FileHasher.use_cache(None)
+	if verbose:
+		print('Hashed %s files in %.1f seconds. %s could not be read, and %s stale cache entries were removed.' % (
+			hashed, time.time() - start, failed, pruned))
+	return hashed, failed, pruned